@@ -5,13 +5,55 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 import numpy as np
-
-def top_german_sports(germany_df, top_n = 10):
+from metrics import timed, laps
+from binning import histogram_bar
+import fastfig
+from cube import EVENT_KEYS, COUNTS, YearCounts
+from hll import grouped_nunique
+from filters import as_rows
+
+
+def _medal_rows(df, count = "athlete", columns = ()):
+    """The medal rows of df (a DataFrame or Rows) with only columns, every column when none are given.
+    With count = "event" a team medal is kept once, as one row per (Games, Event, NOC, Medal),
+    the same counting as MedalCube.query(count = "event")."""
+    if count not in COUNTS:
+        raise ValueError(f"count must be one of {', '.join(COUNTS)}, not {count!r}")
+    medals = as_rows(df).notna("Medal")
+    if count == "event" and columns:
+        return medals.frame(*dict.fromkeys([*columns, *EVENT_KEYS])).drop_duplicates(subset = EVENT_KEYS)[list(columns)]
+    if count == "event":
+        return medals.frame().drop_duplicates(subset = EVENT_KEYS)
+    return medals.frame(*columns)
+
+MEDALS = ["Gold", "Silver", "Bronze"]
+
+def _in_years(df, years):
+    """The rows of df (a DataFrame or Rows) from years = (start, end), both included, every row for None."""
+    rows = as_rows(df)
+    return rows if years is None else rows.between("Year", *years)
+
+def _year_filter(years):
+    """Year filter for MedalCube.query, no filter for None."""
+    return {} if years is None else {"Year": list(range(years[0], years[1] + 1))}
+
+def _with_years(title, years):
+    return title if years is None else f"{title} ({years[0]}-{years[1]})"
+
+@timed("top_german_sports")
+def top_german_sports(germany_df, top_n = 10, cube = None, noc = "GER", count = "athlete"):
     """Makes a barplot showing which sports that Germany has won the most medals in. It filters the DataFrame
-    to include only rows with non-null medals and groups the data by sport. And selects the top N sports."""
-
-    german_medals = germany_df[germany_df["Medal"].notna()].copy()
-    medals_per_sport = german_medals.groupby("Sport")["Medal"].count().reset_index()
+    to include only rows with non-null medals and groups the data by sport. And selects the top N sports.
+    If a MedalCube is given the counts for noc are read from the cube instead of germany_df.
+    count = "event" counts a team medal once instead of once per athlete."""
+
+    t = laps("top_german_sports")
+    if cube is not None:
+        medals_per_sport = cube.query("Sport", name = "Medal", count = count, NOC = noc)
+    else:
+        german_medals = _medal_rows(germany_df, count, ["Sport", "Medal"])
+        medals_per_sport = german_medals.groupby("Sport")["Medal"].count().reset_index()
+    t.lap("groupby")
     top_sports = medals_per_sport.sort_values(by = "Medal", ascending = False).reset_index(drop = True).head(top_n)
 
     fig = px.bar(
@@ -23,52 +65,66 @@ def top_german_sports(germany_df, top_n = 10):
         title = f"Top {top_n} German Sports by Medal Count")
     
     fig.update_layout(xaxis_title = "Sport", yaxis_title = "Number of Medals", legend_title = "", xaxis_tickangle = -45)
-    
+    t.lap("figure")
+
     return fig, top_sports
 
 #Samuel
-def medals_each_year(olympics_df, noc_list, title):
-    """Makes a barplot over medals won each year. Takes input for dataframe, list of NOC's, and title. """
-
-    df = olympics_df[(olympics_df["NOC"].isin(noc_list)) & (olympics_df["Medal"].notna())].copy()
-    df = df.drop_duplicates(subset = ["Year", "Event", "Medal", "NOC"])
-
-    medals_breakdown = df.groupby(["Year", "NOC"])["Medal"].count().reset_index()
-
-    fig = px.bar(medals_breakdown, x = "Year", y = "Medal", color = "NOC", barmode = "group", title = title, labels = {"Year": "Year", "Medal": "Number of Medals", "NOC": "Country Code"})
+@timed("medals_each_year")
+def medals_each_year(olympics_df, noc_list, title, cube = None, count = "event", years = None):
+    """Makes a barplot over medals won each year. Takes input for dataframe, list of NOC's, and title.
+    A team medal counts once unless count = "athlete". If a MedalCube is given the counts are read from the cube.
+    years = (start, end) limits the plot to those years."""
+
+    t = laps("medals_each_year")
+    if cube is not None:
+        medals_breakdown = cube.query(["Year", "NOC"], name = "Medal", count = count, NOC = noc_list, **_year_filter(years))
+    else:
+        df = _medal_rows(_in_years(as_rows(olympics_df).where(NOC = noc_list), years), count, ["Year", "NOC", "Medal"])
+        t.lap("filter", rows = len(df))
+        medals_breakdown = df.groupby(["Year", "NOC"])["Medal"].count().reset_index()
+    t.lap("groupby")
+
+    fig = px.bar(medals_breakdown, x = "Year", y = "Medal", color = "NOC", barmode = "group", title = _with_years(title, years), labels = {"Year": "Year", "Medal": "Number of Medals", "NOC": "Country Code"})
     
     fig.update_layout(xaxis_tickangle = -45, legend_title = "Country Code")
+    t.lap("figure")
     return fig, medals_breakdown
 
 # Funktion för uppgift 1: Histogram över åldrar
+@timed("plot_age_distribution")
 def plot_age_distribution(germany):
+    t = laps("plot_age_distribution")
     df = germany[germany["Age"].notna()]
 
     male = df[df["Sex"] == "M"]
     female = df[df["Sex"] == "F"]
+    t.lap("filter", rows = len(df))
 
     fig = make_subplots(rows=1, cols=2, subplot_titles=["Male athletes", "Female athletes"])
-    male_fig = px.histogram(male, x="Age", nbins=20, opacity=0.75, color_discrete_sequence=["steelblue"])
-    female_fig = px.histogram(female, x="Age", nbins=20, opacity=0.75, color_discrete_sequence=["hotpink"])
-
-    for trace in male_fig.data:
-        fig.add_trace(trace, row=1, col=1)
-
-    for trace in female_fig.data:
-        fig.add_trace(trace, row=1, col=2)
+    fig.add_trace(histogram_bar(male["Age"], 20, opacity=0.75, marker_color="steelblue",
+                                hovertemplate="Age=%{x}<br>count=%{y}<extra></extra>"), row=1, col=1)
+    fig.add_trace(histogram_bar(female["Age"], 20, opacity=0.75, marker_color="hotpink",
+                                hovertemplate="Age=%{x}<br>count=%{y}<extra></extra>"), row=1, col=2)
 
     fig.update_layout(title="Age distribution", showlegend=False, height=500, width=1000)
     fig.update_xaxes(title="Age")
     fig.update_yaxes(title="Number of athletes", row=1, col=1)
+    t.lap("figure")
 
     return fig
 
 #Samuel
-def summer_vs_winter(olympics_df, noc_list = ["GER", "GDR", "FRG"]):
+@timed("summer_vs_winter")
+def summer_vs_winter(olympics_df, noc_list = ["GER", "GDR", "FRG"], cube = None, count = "athlete", years = None):
 
-    df = olympics_df[(olympics_df["NOC"].isin(noc_list)) & (olympics_df["Medal"].notna())].copy()
-
-    season_medals = df.groupby("Season")["Medal"].count().reset_index()
+    t = laps("summer_vs_winter")
+    if cube is not None:
+        season_medals = cube.query("Season", name = "Medal", count = count, NOC = noc_list, **_year_filter(years))
+    else:
+        df = _medal_rows(_in_years(as_rows(olympics_df).where(NOC = noc_list), years), count, ["Season", "Medal"])
+        season_medals = df.groupby("Season")["Medal"].count().reset_index()
+    t.lap("groupby")
 
     fig = px.bar(
         season_medals,
@@ -76,7 +132,7 @@ def summer_vs_winter(olympics_df, noc_list = ["GER", "GDR", "FRG"]):
         y = "Medal",
         color = "Season",
         color_discrete_sequence = px.colors.qualitative.Set1,
-        title="GER, GDR, FRG - Summer vs Winter Olympic Medals",
+        title=_with_years("GER, GDR, FRG - Summer vs Winter Olympic Medals", years),
         labels={"Season": "Season", "Medal": "Number of Medals"}
     )
 
@@ -86,30 +142,40 @@ def summer_vs_winter(olympics_df, noc_list = ["GER", "GDR", "FRG"]):
         showlegend = False,
         width = 700,
         height = 400)
+    t.lap("figure")
     return fig, season_medals
 
 #Sebastian
-def sex_dist_all(df):
-    df_west = df[(df['NOC'] == 'FRG') & (df['Year'].between(1968, 1988))]
-    df_east = df[(df['NOC'] == 'GDR') & (df['Year'].between(1968, 1988))]
-    df_unified = df[(df['NOC'] == 'GER') & (df['Year'].between(1956, 1996))]
-
+@timed("sex_dist_all")
+def sex_dist_all(df, years = None, counts = None):
+    """Pie charts of the gender distribution of FRG and GDR (1968-1988) and unified Germany (1956-1996), or of all
+    three for years = (start, end). The counts are read from a YearCounts (counts, or one built from df)."""
+    t = laps("sex_dist_all")
+    if counts is None:
+        counts = YearCounts(df)
+    t.lap("filter")
+
+    west_years = east_years = years or (1968, 1988)
+    unified_years = years or (1956, 1996)
     sex_data = {
-        'West Germany (FRG, 1968-1988)': df_west['Sex'].value_counts().reindex(['M', 'F'], fill_value=0),
-        'East Germany (GDR, 1968-1988)': df_east['Sex'].value_counts().reindex(['M', 'F'], fill_value=0),
-        'Germany (1956-1996)': df_unified['Sex'].value_counts().reindex(['M', 'F'], fill_value=0)
+        f'West Germany (FRG, {west_years[0]}-{west_years[1]})': counts.count(*west_years, 'Sex', NOC='FRG').reindex(['M', 'F'], fill_value=0),
+        f'East Germany (GDR, {east_years[0]}-{east_years[1]})': counts.count(*east_years, 'Sex', NOC='GDR').reindex(['M', 'F'], fill_value=0),
+        f'Germany ({unified_years[0]}-{unified_years[1]})': counts.count(*unified_years, 'Sex', NOC='GER').reindex(['M', 'F'], fill_value=0)
     }
+    t.lap("groupby")
 
-    fig = make_subplots(
+    #fastfig i stället för make_subplots, figuren byggs om för varje rörelse i årsreglaget.
+    fig = fastfig.subplots(
         rows=1, cols=3,
         specs=[[{'type': 'domain'}]*3],
         subplot_titles=list(sex_data.keys())
     )
     
-    for i, (title, counts) in enumerate(sex_data.items()):
-        fig.add_trace(go.Pie(
-            labels=counts.index,
-            values=counts.values,
+    for i, (title, sex_counts) in enumerate(sex_data.items()):
+        fig.add_trace(fastfig.trace(
+            'pie',
+            labels=sex_counts.index.tolist(),
+            values=sex_counts.to_numpy(),
             marker_colors=['grey', 'orange'],
             name=title,
             showlegend=True
@@ -117,14 +183,19 @@ def sex_dist_all(df):
 
     fig.update_layout(title_text='Gender Distribution Comparison: East (GDR), West (FRG), and Unified Germany.',
                       title_x = 0.5)
-    return fig
+    t.lap("figure")
+    return fig.build()
 
 #Sebastian
-def sex_dist_divided(df, years):
-    """Creates a 2-row subplot of pie charts showing gender distribution for selected Olympic years. More or less years can be selected."""
+@timed("sex_dist_divided")
+def sex_dist_divided(df, years, counts = None):
+    """Creates a 2-row subplot of pie charts showing gender distribution for selected Olympic years. More or less years can be selected.
+    The counts per year are read from a YearCounts (counts, or one built from df) instead of filtering df once per year."""
 
-    east_germany = df[df['NOC'] == 'GDR'].copy()
-    west_germany = df[df['NOC'] == 'FRG'].copy()
+    t = laps("sex_dist_divided")
+    if counts is None:
+        counts = YearCounts(df)
+    t.lap("filter")
 
     fig = make_subplots(
         rows=2, cols=len(years),
@@ -133,7 +204,7 @@ def sex_dist_divided(df, years):
     )
 
     for i, year in enumerate(years):
-        west_data = west_germany[west_germany['Year'] == year]['Sex'].value_counts().reindex(['M', 'F'], fill_value=0)
+        west_data = counts.count(year, year, 'Sex', NOC='FRG').reindex(['M', 'F'], fill_value=0)
         fig.add_trace(go.Pie(
             labels=west_data.index,
             values=west_data.values,
@@ -142,7 +213,7 @@ def sex_dist_divided(df, years):
             showlegend=False
         ), row=1, col=i+1)
 
-        east_data = east_germany[east_germany['Year'] == year]['Sex'].value_counts().reindex(['M', 'F'], fill_value=0)
+        east_data = counts.count(year, year, 'Sex', NOC='GDR').reindex(['M', 'F'], fill_value=0)
         fig.add_trace(go.Pie(
             labels=east_data.index,
             values=east_data.values,
@@ -157,25 +228,29 @@ def sex_dist_divided(df, years):
         title_text="Gender Distribution in Olympic Teams During Germany's Division: East (GDR) vs West (FRG)",
         title_x=0.5
     )
+    t.lap("figure")
     return fig
 
 #Samuel
-def medal_distribution_weight_height(olympics_df, sport="Ski Jumping"):
-    """Plots histogram of medal winning athletes based on their weight and height."""
+@timed("medal_distribution_weight_height")
+def medal_distribution_weight_height(olympics_df, sport="Ski Jumping", years = None):
+    """Plots histogram of medal winning athletes based on their weight and height, in years = (start, end) if given."""
 
-    df = olympics_df[(olympics_df["Sport"] == sport) & (olympics_df["Medal"].notna())].copy()
+    t = laps("medal_distribution_weight_height")
+    df = _in_years(as_rows(olympics_df).where(Sport = sport), years).notna("Medal").frame("Weight", "Height")
+    t.lap("filter", rows = len(df))
 
-    fig = make_subplots(rows = 1, cols = 2, subplot_titles = (f"Medals vs. Weight in {sport}",
+    fig = fastfig.subplots(rows = 1, cols = 2, subplot_titles = (f"Medals vs. Weight in {sport}",
                                                         f"Medals vs. Height in {sport}"))
     
-    weight_hist = go.Histogram(x = df["Weight"], nbinsx = 15, marker_color = "skyblue")
+    weight_hist = histogram_bar(df["Weight"], 15, bargap = 0.1, marker_color = "skyblue")
     fig.add_trace(weight_hist, row = 1, col = 1)
     
-    height_hist = go.Histogram(x = df["Height"], nbinsx = 15, marker_color="lightgreen")
+    height_hist = histogram_bar(df["Height"], 15, bargap = 0.1, marker_color="lightgreen")
     fig.add_trace(height_hist, row = 1, col = 2)
     
     fig.update_layout(
-        title_text = f"Medal Distribution by Weight and Height in {sport}",
+        title_text = _with_years(f"Medal Distribution by Weight and Height in {sport}", years),
         xaxis_title = "Weight (kg)",
         yaxis_title = "Number of Medals",
         xaxis2_title = "Height (cm)",
@@ -185,21 +260,31 @@ def medal_distribution_weight_height(olympics_df, sport="Ski Jumping"):
         width = 1000,
         height = 500
     )
-    return fig, df
+    t.lap("figure")
+    return fig.build(), df
 
 #Sebastian
-def age_dist_per_sex(global_df, germany_df, country, sport):
+@timed("age_dist_per_sex")
+def age_dist_per_sex(global_df, germany_df, country, sport, years = None):
     """Makes a histplot over the chosen sports agespan, one for the chosen countrys male and female contenders, and one for the sports global agespan. \n
-    Input a global dataframe, the dataframe for your selected country, the country name, and the chosen sport."""
-
-    german_men = germany_df[(germany_df['Sport'] == sport) & (germany_df['Sex'] == 'M')]
-    german_women = germany_df[(germany_df['Sport'] == sport) & (germany_df['Sex'] == 'F')]
-    global_df = global_df[global_df['Sport'] == sport]
-    men_mean = german_men['Age'].mean()
-    women_mean = german_women['Age'].mean()
-    global_mean = global_df['Age'].mean()
-
-    fig = make_subplots(
+    Input a global dataframe, the dataframe for your selected country, the country name, and the chosen sport.
+    years = (start, end) keeps only the contenders of those years."""
+
+    t = laps("age_dist_per_sex")
+    country_rows = _in_years(as_rows(germany_df).where(Sport = sport), years)
+    #Sportvillkoret räknas ut en gång, könsgrupperna filtrerar sedan bara de raderna.
+    country_rows.positions()
+    men_age = country_rows.where(Sex = 'M').column('Age')
+    women_age = country_rows.where(Sex = 'F').column('Age')
+    global_age = _in_years(as_rows(global_df).where(Sport = sport), years).column('Age')
+    t.lap("filter", rows = len(global_age))
+    #Age är Int8 med NA, float64 ger nan i stället för NA när en grupp saknar värden.
+    men_mean = men_age.astype('float64').mean()
+    women_mean = women_age.astype('float64').mean()
+    global_mean = global_age.astype('float64').mean()
+    t.lap("groupby")
+
+    fig = fastfig.subplots(
         rows=1, cols=2,
         subplot_titles=[
             f"{country} – Age Distribution in {sport}",
@@ -208,15 +293,15 @@ def age_dist_per_sex(global_df, germany_df, country, sport):
         shared_yaxes=True
     )
 
-    fig.add_trace(go.Histogram(x=german_men['Age'], name='Men', nbinsx=20, histnorm='percent', marker_color='black', opacity=0.5,
+    fig.add_trace(histogram_bar(men_age, 20, histnorm='percent', name='Men', marker_color='black', opacity=0.5,
         hovertemplate='Group=Men<br>Age=%{x}<br>percent=%{y}<extra></extra>'
     ), row=1, col=1)
 
-    fig.add_trace(go.Histogram(x=german_women['Age'], name='Women', nbinsx=20, histnorm='percent', marker_color='orange', opacity=0.5,
+    fig.add_trace(histogram_bar(women_age, 20, histnorm='percent', name='Women', marker_color='orange', opacity=0.5,
         hovertemplate='Group=Women<br>Age=%{x}<br>percent=%{y}<extra></extra>'
     ), row=1, col=1)
 
-    fig.add_trace(go.Histogram(x=global_df['Age'], name='Global', nbinsx=20, histnorm='percent', marker_color='skyblue',
+    fig.add_trace(histogram_bar(global_age, 20, histnorm='percent', name='Global', marker_color='skyblue',
         hovertemplate='Age=%{x}<br>percent=%{y}<extra></extra>'
     ), row=1, col=2)
 
@@ -228,7 +313,7 @@ def age_dist_per_sex(global_df, germany_df, country, sport):
     fig.add_vline(x=global_mean, line_dash='dash', line_color='blue',
                   annotation_text=f"Global mean: {global_mean:.1f}", annotation_position="top right", row=1, col=2)
 
-    fig.update_layout(barmode='overlay', title_text=f"{country} - Age Distribution in {sport}", 
+    fig.update_layout(barmode='overlay', title_text=_with_years(f"{country} - Age Distribution in {sport}", years),
         title_x=0.5,
         height=500,
         width=1000,
@@ -237,96 +322,165 @@ def age_dist_per_sex(global_df, germany_df, country, sport):
         xaxis2_title='Age',
         yaxis_title='Contenders (percent)'
     )
+    t.lap("figure")
 
-    return fig
+    return fig.build()
+
+def _medal_share(rows):
+    """Medal rows per 100 rows. Groups without participants (common for smaller countries) get 0 instead of a division by zero."""
+    #Raderna räknas ut innan notna läggs till, annars körs deras villkor två gånger.
+    total = len(rows)
+    return len(rows.notna('Medal')) / total * 100 if total else 0
 
 #Sebastian #Note: Något skevt händer. Gör en temporär fix längst ned.
-def plot_efficiency(global_df, germany_df, country, sport):
+@timed("plot_efficiency")
+def plot_efficiency(global_df, germany_df, country, sport, years = None, counts = None, nocs = None):
     """Plots the efficiency of the selected countrys contenders in the selected sport, and gives a comparison to the global efficiency. \n
-    Input one global dataframe, one dataframe for the country and the selected sport."""
-
-    global_df = global_df[global_df['Sport'] == sport]
-    german_men = germany_df[(germany_df['Sport'] == sport) & (germany_df['Sex'] == 'M')]
-    german_females = germany_df[(germany_df['Sport'] == sport) & (germany_df['Sex'] == 'F')]
-
-    global_eff = global_df['Medal'].notna().sum() / len(global_df) * 100
-    male_eff = german_men['Medal'].notna().sum() / len(german_men) * 100
-    female_eff = german_females['Medal'].notna().sum() / len(german_females) * 100
+    Input one global dataframe, one dataframe for the country and the selected sport. years = (start, end) limits it to those years.
+    With counts (a YearCounts) and nocs, the NOC codes of the country, the rows are counted from counts and the frames are not used."""
+
+    t = laps("plot_efficiency")
+    if counts is not None:
+        start, end = years or counts.span()
+        everyone = counts.count(start, end, 'Sex', Sport = sport, NOC = nocs).reindex(['M', 'F'], fill_value = 0)
+        medalists = counts.count(start, end, 'Sex', Sport = sport, NOC = nocs, Medal = MEDALS).reindex(['M', 'F'], fill_value = 0)
+        global_total = counts.count(start, end, 'Sport', Sport = sport).sum()
+        global_medals = counts.count(start, end, 'Sport', Sport = sport, Medal = MEDALS).sum()
+        t.lap("filter", rows = global_total)
+
+        global_eff = global_medals / global_total * 100 if global_total else 0
+        male_eff, female_eff = (medalists[sex] / everyone[sex] * 100 if everyone[sex] else 0 for sex in ['M', 'F'])
+    else:
+        #Bara antal rader behövs, inga kolumner kopieras.
+        global_rows = _in_years(as_rows(global_df).where(Sport = sport), years)
+        country_rows = _in_years(as_rows(germany_df).where(Sport = sport), years)
+        #Sportvillkoret räknas ut en gång, könsgrupperna filtrerar sedan bara de raderna.
+        country_rows.positions()
+        german_men = country_rows.where(Sex = 'M')
+        german_females = country_rows.where(Sex = 'F')
+        t.lap("filter", rows = len(global_rows))
+
+        global_eff = _medal_share(global_rows)
+        male_eff = _medal_share(german_men)
+        female_eff = _medal_share(german_females)
 
     grouped = pd.DataFrame({
-        'Group': ['Germany - Men', 'Germany - Women', 'Global'],
+        'Group': [f'{country} - Men', f'{country} - Women', 'Global'],
         'Efficiency': [male_eff, female_eff, global_eff]
         })
-    fig = px.bar(grouped, x='Group', y='Efficiency', color='Group',
-                 text=grouped['Efficiency'].round(1),
-                 title=f'{country} - Medal Efficiency in {sport}',
-                 labels={'Efficiency': 'Medaljer per 100 deltagare'},
-                 color_discrete_sequence=['black', 'orange', 'skyblue'])
-    
+    t.lap("groupby")
+    #Samma figur som px.bar(grouped, x='Group', y='Efficiency', color='Group', text=...) ger, en stapel per grupp.
+    fig = fastfig.subplots()
+    efficiency = grouped['Efficiency'].to_numpy()
+    text = grouped['Efficiency'].round(1).to_numpy()
+    for i, (group, color) in enumerate(zip(grouped['Group'], ['black', 'orange', 'skyblue'])):
+        fig.add_trace(fastfig.bar(
+            x=[group], y=efficiency[i:i + 1], text=text[i:i + 1], name=group, legendgroup=group,
+            marker_color=color, marker_pattern_shape='', orientation='v', showlegend=True,
+            hovertemplate='Group=%{x}<br>Medaljer per 100 deltagare=%{y}<br>text=%{text}<extra></extra>'
+        ), row=1, col=1)
+
     fig.update_traces(textposition='outside')
+    fig.update_layout(title_text=_with_years(f'{country} - Medal Efficiency in {sport}', years), xaxis_title='Group',
+                      xaxis_categoryorder='array', xaxis_categoryarray=list(grouped['Group']),
+                      yaxis_title='Medaljer per 100 deltagare', legend_title_text='Group', legend_tracegroupgap=0,
+                      barmode='relative')
     fig.update_layout(showlegend=False, yaxis_range=[0, max(grouped['Efficiency']) * 1.2])
-    return fig
+    t.lap("figure")
+    return fig.build()
 
 #Sebastian #Note: Något skevt händer även här. Gör en temporät fix längst ned.
-def medal_distribution(df, sport): #EGEN note: denna ska göras till dropdown-meny, så att användaren kan välja olika länder!
-    """Creates an interactive bar chart of medal counts per country for a given sport using Plotly."""
+@timed("medal_distribution")
+def medal_distribution(df, sport, cube = None, noc = "GER", count = "athlete", years = None, counts = None):
+    """Creates an interactive bar chart of medal counts per country for a given sport using Plotly.
+    The top 10 countries are shown, plus noc (one NOC code or a list of them) if it is not among them.
+    If a MedalCube is given the counts are read from the cube and df is not used. count = "event" counts a team medal once.
+    years = (start, end) counts only the medals of those years. Athlete counts are then read from counts, a YearCounts, if given."""
+    t = laps("medal_distribution")
     palette = {
         'Gold': "#DABE1E",
         'Silver': '#C0C0C0',
         'Bronze': '#CD7F32'
     }
 
-    df = df[(df['Sport'] == sport) & (df['Medal'].notna())].copy()
-    total_medals = df.groupby('NOC').size().sort_values(ascending=False)
+    #Årsintervallet räknas ur de kumulativa årsräkningarna, två uppslag per nyckel oavsett intervall.
+    from_counts = years is not None and counts is not None and count == "athlete"
+    if from_counts:
+        total_medals = counts.count(*years, 'NOC', Sport=sport, Medal=MEDALS)
+        total_medals = total_medals[total_medals > 0].sort_values(ascending=False)
+    elif cube is not None:
+        total_medals = cube.query('NOC', count=count, Sport=sport, **_year_filter(years)).set_index('NOC')['Count'].sort_values(ascending=False)
+    else:
+        df = _medal_rows(_in_years(as_rows(df).where(Sport = sport), years), count, ['NOC', 'Medal'])
+        total_medals = df.groupby('NOC').size().sort_values(ascending=False)
 
     top_nocs = total_medals.head(10).index.tolist()
-    if 'GER' not in top_nocs:
-        top_nocs.append('GER')
-
-    medals = df[df['NOC'].isin(top_nocs)]
-    medals = medals.groupby(['NOC', 'Medal']).size().reset_index(name='Count')
-
-    fig = px.bar(
-        medals,
-        x='NOC',
-        y='Count',
-        color='Medal',
-        color_discrete_map=palette,
-        title=f"Medal Distribution in {sport} by Country (Olympic History)",
-        labels={'NOC': 'Country (NOC)', 'Count': 'Number of Medals'}
-    )
-
+    for extra in ([noc] if isinstance(noc, str) else noc):
+        if extra not in top_nocs:
+            top_nocs.append(extra)
+
+    if from_counts:
+        medals = counts.count(*years, ['NOC', 'Medal'], Sport=sport, NOC=top_nocs, Medal=MEDALS).reset_index()
+        medals = medals[medals['Count'] > 0]
+    elif cube is not None:
+        medals = cube.query(['NOC', 'Medal'], count=count, Sport=sport, NOC=top_nocs, **_year_filter(years))
+    else:
+        medals = df[df['NOC'].isin(top_nocs)]
+        medals = medals.groupby(['NOC', 'Medal']).size().reset_index(name='Count')
+    t.lap("groupby")
+
+    #Samma figur som px.bar(medals, x='NOC', y='Count', color='Medal', ...) ger, en trace per medalj
+    #i den ordning medaljerna först förekommer.
+    fig = fastfig.subplots()
+    for medal in pd.unique(medals['Medal']):
+        rows = medals[medals['Medal'] == medal]
+        fig.add_trace(fastfig.bar(
+            x=rows['NOC'].tolist(), y=rows['Count'].to_numpy(), name=medal, legendgroup=medal,
+            marker_color=palette[medal], marker_pattern_shape='', orientation='v', showlegend=True, textposition='auto',
+            hovertemplate=f'Medal={medal}<br>Country (NOC)=%{{x}}<br>Number of Medals=%{{y}}<extra></extra>'
+        ), row=1, col=1)
+
+    history = 'Olympic History' if years is None else f'{years[0]}-{years[1]}'
+    fig.update_layout(title_text=f"Medal Distribution in {sport} by Country ({history})",
+                      xaxis_title='Country (NOC)', yaxis_title='Number of Medals',
+                      legend_title_text='Medal', legend_tracegroupgap=0)
     fig.update_layout(barmode='stack', xaxis_tickangle=-45)
-    return fig
+    t.lap("figure")
+    return fig.build()
 
 #Samuel
-def stats_for_country(df, country):
-
-    country_data = df[df["Team"] == country].copy()
-
-    medal_data = country_data[country_data["Medal"].notna()]
-    medal_counts = (
-        medal_data.groupby("Sport")["Medal"]
-        .count()
-        .sort_values(ascending = False)
-        .head(10))
-
-    fig = make_subplots(
+@timed("stats_for_country")
+def stats_for_country(df, country, cube = None, count = "athlete"):
+
+    t = laps("stats_for_country")
+    country_data = as_rows(df).where(Team = country)
+    t.lap("filter", rows = len(country_data))
+
+    if cube is not None:
+        medal_counts = cube.query("Sport", name = "Medal", count = count, Team = country).set_index("Sport")["Medal"]
+    else:
+        medal_data = _medal_rows(country_data, count, ["Sport", "Medal"])
+        medal_counts = medal_data.groupby("Sport")["Medal"].count()
+    medal_counts = medal_counts.sort_values(ascending = False).head(10)
+    t.lap("groupby")
+
+    fig = fastfig.subplots(
         rows = 1, cols = 2,
         subplot_titles = (f"Topp 10 sporter - medaljfördelning ({country})", 
         f"Åldersfördelning bland idrottare - {country}"))
     
-    bar_trace = go.Bar(
-        x = medal_counts.values,
-        y = medal_counts.index,
+    bar_trace = fastfig.bar(
+        x = medal_counts.to_numpy(),
+        y = medal_counts.index.tolist(),
         orientation = "h",
         marker_color = "steelblue")
     
     fig.add_trace(bar_trace, row = 1, col = 1)
     
-    age_trace = go.Histogram(
-        x = country_data["Age"].dropna(),
-        nbinsx = 20,
+    age_trace = histogram_bar(
+        country_data.column("Age").dropna(),
+        20,
+        bargap = 0.1,
         marker_color = "skyblue")
     
     fig.add_trace(age_trace, row = 1, col = 2)
@@ -341,42 +495,48 @@ def stats_for_country(df, country):
         showlegend = False,
         width = 1000,
         height = 500)
-    
-    return fig, medal_counts
+    t.lap("figure")
+
+    return fig.build(), medal_counts
 
 #Samuel
-def stats_for_sport(df, sport, top_n = 10):
-
-    sport_data = df[df["Sport"] == sport].copy()
- 
-    medal_data = sport_data[sport_data["Medal"].notna()]
-    medal_counts = (
-        medal_data.groupby("Team")["Medal"]
-        .count()
-        .sort_values(ascending = False)
-        .head(top_n))
+@timed("stats_for_sport")
+def stats_for_sport(df, sport, top_n = 10, cube = None, count = "athlete", years = None):
+
+    t = laps("stats_for_sport")
+    sport_data = _in_years(as_rows(df).where(Sport = sport), years)
+    t.lap("filter", rows = len(sport_data))
+
+    if cube is not None:
+        medal_counts = cube.query("Team", name = "Medal", count = count, Sport = sport, **_year_filter(years)).set_index("Team")["Medal"]
+    else:
+        medal_data = _medal_rows(sport_data, count, ["Team", "Medal"])
+        medal_counts = medal_data.groupby("Team")["Medal"].count()
+    medal_counts = medal_counts.sort_values(ascending = False).head(top_n)
+    t.lap("groupby")
     
-    fig = make_subplots(
+    fig = fastfig.subplots(
         rows = 1, cols = 2,
         subplot_titles = (f"Topp {top_n} länder - medaljfördelning ({sport})",
         f"Åldersfördelning bland idrottare - {sport}"))
     
-    bar_trace = go.Bar(
-        x = medal_counts.values,
-        y = medal_counts.index,
+    bar_trace = fastfig.bar(
+        x = medal_counts.to_numpy(),
+        y = medal_counts.index.tolist(),
         orientation = "h",
         marker_color = "steelblue")
     fig.add_trace(bar_trace, row = 1, col = 1)
     
-    age_trace = go.Histogram(
-        x = sport_data["Age"].dropna(),
-        nbinsx = 20,
+    age_trace = histogram_bar(
+        sport_data.column("Age").dropna(),
+        20,
+        bargap = 0.1,
         marker_color = "skyblue")
     
     fig.add_trace(age_trace, row = 1, col = 2)
 
     fig.update_layout(
-        title_text = f"Olympic Stats for {sport}",
+        title_text = _with_years(f"Olympic Stats for {sport}", years),
         xaxis_title = "Antal medaljer",
         yaxis_title = "Land",
         xaxis2_title = "Ålder",
@@ -385,12 +545,21 @@ def stats_for_sport(df, sport, top_n = 10):
         showlegend = False,
         width = 1000,
         height = 500)
-    
-    return fig, medal_counts
+    t.lap("figure")
+
+    return fig.build(), medal_counts
 
 #Sebastian
-def plot_participants(df):
-    participants = df.groupby(["Year", "NOC", "Season"])["Hash_Names"].nunique().reset_index(name='Participants')
+@timed("plot_participants")
+def plot_participants(df, error = None):
+    """Line chart of distinct participants per year, NOC and season, counted on the int32 Athlete keys. With
+    error (e.g. 0.01) the counts are HyperLogLog estimates with that relative standard error instead."""
+    t = laps("plot_participants")
+    if error is not None:
+        participants = grouped_nunique(df, ["Year", "NOC", "Season"], "Hash_Names", error).reset_index(name='Participants')
+    else:
+        participants = df.groupby(["Year", "NOC", "Season"])["Athlete"].nunique().reset_index(name='Participants')
+    t.lap("groupby", rows = len(df))
 
     fig = px.line(
         participants,
@@ -407,17 +576,28 @@ def plot_participants(df):
         yaxis_title='Antal deltagare',
         legend_title='Nation'
     )
+    t.lap("figure")
 
     return fig, participants
 
 #Mattias
-def medal_e_v_ger(east_germany, west_germany):
-
-    east = east_germany[['Year', 'Medal']].dropna(subset=['Medal'])
-    east_medals = east.groupby(['Year','Medal']).size().unstack(fill_value = 0)
-
-    west = west_germany[['Year','Medal']].dropna(subset=['Medal'])
-    west_medals = west.groupby(['Year','Medal']).size().unstack(fill_value = 0)
+@timed("medal_e_v_ger")
+def medal_e_v_ger(east_germany, west_germany, cube = None, count = "athlete", years = None):
+    """Compares medals per year for East and West Germany. If a MedalCube is given the counts for GDR and FRG
+    are read from the cube and the two frames are not used. count = "event" counts a team medal once.
+    years = (start, end) limits the comparison to those years."""
+
+    t = laps("medal_e_v_ger")
+    if cube is not None:
+        east_medals = cube.query(['Year', 'Medal'], count = count, NOC = 'GDR', **_year_filter(years)).set_index(['Year', 'Medal'])['Count'].unstack(fill_value = 0)
+        west_medals = cube.query(['Year', 'Medal'], count = count, NOC = 'FRG', **_year_filter(years)).set_index(['Year', 'Medal'])['Count'].unstack(fill_value = 0)
+    else:
+        east = _medal_rows(_in_years(east_germany, years), count, ['Year', 'Medal'])
+        east_medals = east.groupby(['Year','Medal']).size().unstack(fill_value = 0)
+
+        west = _medal_rows(_in_years(west_germany, years), count, ['Year', 'Medal'])
+        west_medals = west.groupby(['Year','Medal']).size().unstack(fill_value = 0)
+    t.lap("groupby")
 
     fallen_years = sorted(set(west_medals.index).union(set(east_medals.index)))
     Dif_medals = ['Gold','Silver','Bronze']
@@ -447,23 +627,26 @@ def medal_e_v_ger(east_germany, west_germany):
 
     fig.update_layout(
         height = 500, width = 1200,
-        title_text = "East vs West Germany Medal Comparison",
+        title_text = _with_years("East vs West Germany Medal Comparison", years),
         barmode = "group",
         xaxis = dict(tickangle = 45),
         xaxis2 = dict(tickangle = 45),
         xaxis3 = dict(tickangle = 45)
     )
+    t.lap("figure")
     return fig
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-def sex_biat(olympics_df: pd.DataFrame, sport: str = "Biathlon"):
+@timed("sex_biat")
+def sex_biat(olympics_df: pd.DataFrame, sport: str = "Biathlon", years: tuple = None):
     """
     Visualize medal winners separated by gender for a given sport:
     - Bar chart: medal counts per NOC split by Sex
-    - Histogram: Age distribution of male vs female medalists
+    - Histogram: Age distribution of male vs female medalists (binned on the server)
+    Only the medalists of years = (start, end) are shown if given.
     Returns a Plotly figure.
     """
 
@@ -473,13 +656,15 @@ def sex_biat(olympics_df: pd.DataFrame, sport: str = "Biathlon"):
     if missing:
         raise ValueError(f"Input dataframe saknar kolumner: {', '.join(sorted(missing))}")
 
-    # Filtrera: vald sport + medaljtagare
-    sport_df = olympics_df.loc[olympics_df["Sport"] == sport].copy()
-    sport_df = sport_df.dropna(subset=["Medal", "Sex", "NOC"])
+    t = laps("sex_biat")
+
+    # Filtrera: vald sport + medaljtagare, bara kolumnerna som används
+    sport_df = _in_years(as_rows(olympics_df).where(Sport = sport), years).notna("Medal", "Sex", "NOC").frame("NOC", "Sex", "Age")
 
     # Dela upp efter kön
     m_df = sport_df.loc[sport_df["Sex"] == "M"].dropna(subset=["Age"])
     f_df = sport_df.loc[sport_df["Sex"] == "F"].dropna(subset=["Age"])
+    t.lap("filter", rows = len(sport_df))
 
     # Grupp för NOC x Sex (medaljantal)
     noc_counts = (
@@ -488,9 +673,10 @@ def sex_biat(olympics_df: pd.DataFrame, sport: str = "Biathlon"):
         .reset_index(name="count")
         .sort_values(["NOC", "Sex"])
     )
+    t.lap("groupby")
 
     # Skapa subplots: 1 rad, 3 kolumner
-    fig = make_subplots(
+    fig = fastfig.subplots(
         rows=1, cols=3,
         column_widths=[0.42, 0.29, 0.29],
         subplot_titles=[
@@ -506,27 +692,27 @@ def sex_biat(olympics_df: pd.DataFrame, sport: str = "Biathlon"):
     f_counts = noc_counts[noc_counts["Sex"] == "F"].set_index("NOC").reindex(noc_list)["count"].fillna(0)
 
     fig.add_trace(
-        go.Bar(x=noc_list, y=m_counts, name="Male", marker_color="grey",
+        fastfig.bar(x=noc_list, y=m_counts.to_numpy(), name="Male", marker_color="grey",
                hovertemplate="NOC=%{x}<br>Medals=%{y}<extra></extra>"),
         row=1, col=1
     )
     fig.add_trace(
-        go.Bar(x=noc_list, y=f_counts, name="Female", marker_color="orange",
+        fastfig.bar(x=noc_list, y=f_counts.to_numpy(), name="Female", marker_color="orange",
                hovertemplate="NOC=%{x}<br>Medals=%{y}<extra></extra>"),
         row=1, col=1
     )
 
     # 2) Histogram för män
     fig.add_trace(
-        go.Histogram(x=m_df["Age"], nbinsx=20, marker_color="grey", name="Male ages",
-                     hovertemplate="Age=%{x}<br>Count=%{y}<extra></extra>"),
+        histogram_bar(m_df["Age"], 20, bargap=0.2, marker_color="grey", name="Male ages",
+                      hovertemplate="Age=%{x}<br>Count=%{y}<extra></extra>"),
         row=1, col=2
     )
 
     # 3) Histogram för kvinnor
     fig.add_trace(
-        go.Histogram(x=f_df["Age"], nbinsx=20, marker_color="orange", name="Female ages",
-                     hovertemplate="Age=%{x}<br>Count=%{y}<extra></extra>"),
+        histogram_bar(f_df["Age"], 20, bargap=0.2, marker_color="orange", name="Female ages",
+                      hovertemplate="Age=%{x}<br>Count=%{y}<extra></extra>"),
         row=1, col=3
     )
 
@@ -544,7 +730,7 @@ def sex_biat(olympics_df: pd.DataFrame, sport: str = "Biathlon"):
 
     # Layout och axlar
     fig.update_layout(
-        title_text=f"{sport} medalists — gender and age",
+        title_text=_with_years(f"{sport} medalists — gender and age", years),
         title_x=0.5,
         height=500,
         width=1200,
@@ -561,5 +747,6 @@ def sex_biat(olympics_df: pd.DataFrame, sport: str = "Biathlon"):
 
     fig.update_xaxes(title_text="Age", row=1, col=3)
     fig.update_yaxes(title_text="Count", row=1, col=3)
+    t.lap("figure")
 
-    return fig
\ No newline at end of file
+    return fig.build()
\ No newline at end of file
@@ -1,5 +1,5 @@
 import pandas as pd
-import hashlib
+from load_data import hash_names
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
@@ -7,7 +7,7 @@ from plotly.subplots import make_subplots
 # Anonymisera namn
 def hashed_names(olympics_df):
     germany_all = olympics_df[olympics_df["NOC"].isin(["GER", "GDR", "FRG"])].copy()
-    germany_all["Name"] = germany_all["Name"].apply(lambda x: hashlib.sha256(x.encode("utf-8")).hexdigest())
+    germany_all["Name"] = hash_names(germany_all["Name"], persist=False)
     germany_all = germany_all.rename(columns={"Name": "Hash_Names"}).reset_index(drop=True)
     germany = germany_all[germany_all["NOC"] == "GER"]
     return germany, germany_all
@@ -0,0 +1,240 @@
+"""DuckDB backend over Parquet files, for data that does not fit in memory.
+
+The default backend is pandas: dataset.Dataset holds the cleaned frames in memory with a PartitionIndex, a
+CountryIndex and a MedalCube built from them. DuckDBDataset has the same attributes and methods, but answers them
+with SQL over the Parquet files in OS_PARQUET_DIR. The Sport/NOC/Medal predicates and the medal counts run in
+DuckDB, and only the rows of the selected sport and country (and the small German subsets) reach pandas, so the
+Functions.py code runs unchanged on the partitions it gets.
+
+    python backend.py --export          # writes the cleaned data from load_data.py as Parquet
+    OS_BACKEND=duckdb gunicorn main:server
+
+Every *.parquet file in the directory is part of the data, so an extension (more years, another dataset in the
+same columns) is added by writing another file, e.g. with DuckDBDataset.append or main.append_games.
+Requires the duckdb package.
+"""
+import os
+import pandas as pd
+from load_data import CACHE_DIR, SCHEMA, apply_schema, check_new_games
+from partitions import CountryIndex
+from filters import Rows
+from cube import CUBE_KEYS, EVENT_KEYS, EVENT_COLUMNS, COUNTS, PREFIX_KEYS, YearCounts
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+BACKEND = os.environ.get("OS_BACKEND", "pandas")
+PARQUET_DIR = os.environ.get("OS_PARQUET_DIR", os.path.join(CACHE_DIR, "parquet"))
+ROW_GROUP_SIZE = 100_000
+GERMAN_NOCS = ["GER", "FRG", "GDR"]
+
+
+def _where(filters, medals_only = False):
+    """A WHERE clause and its parameters for filters in the MedalCube.select form, col = value or col = [values]."""
+    clauses, params = [], []
+    if medals_only:
+        clauses.append('"Medal" IS NOT NULL')
+    for col, value in filters.items():
+        if isinstance(value, (list, tuple, set)):
+            value = list(value)
+            if not value:
+                clauses.append("FALSE")
+                continue
+            clauses.append(f'"{col}" IN ({", ".join("?" * len(value))})')
+            params.extend(value)
+        else:
+            clauses.append(f'"{col}" = ?')
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def _columns(cols):
+    return ", ".join(f'"{col}"' for col in cols)
+
+
+def _keys_schema(df, keys):
+    """Casts the key columns of an aggregate to the compact schema, but not the counts (a count may be called Medal)."""
+    return df.astype({col: SCHEMA[col] for col in keys if col in SCHEMA})
+
+
+def export_parquet(olympics, directory = PARQUET_DIR, name = "olympics-00000"):
+    """Writes olympics as one Parquet file in directory, sorted on Sport and NOC so that DuckDB can skip the row
+    groups of other sports. The index is kept in __index__, queries return the rows in index order."""
+    os.makedirs(directory, exist_ok = True)
+    path = os.path.join(directory, f"{name}.parquet")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    df = olympics.reset_index(names = "__index__").sort_values(["Sport", "NOC", "__index__"], kind = "stable")
+    df.to_parquet(tmp, index = False, row_group_size = ROW_GROUP_SIZE)
+    os.replace(tmp, path)
+    return path
+
+
+class DuckDBQuery:
+    """An in-process DuckDB connection with the Parquet files in directory as the view olympics, and the view
+    events with one row per (Games, Event, NOC, Medal) like MedalCube.events. Safe to use from several threads,
+    every query gets its own cursor."""
+
+    def __init__(self, directory = PARQUET_DIR):
+        if duckdb is None:
+            raise ImportError("OS_BACKEND=duckdb requires the duckdb package")
+        self.directory = directory
+        files = os.path.join(directory, "*.parquet").replace("'", "''")
+        self.con = duckdb.connect()
+        self.con.execute(f"CREATE VIEW olympics AS SELECT * FROM read_parquet('{files}', union_by_name = true)")
+        self.con.execute(f"""CREATE VIEW events AS
+            SELECT {_columns(EVENT_KEYS)}, {", ".join(f'first("{col}" ORDER BY __index__) AS "{col}"' for col in EVENT_COLUMNS)},
+                   count(*) AS "Athletes"
+            FROM olympics WHERE "Medal" IS NOT NULL GROUP BY {_columns(EVENT_KEYS)}""")
+
+    def df(self, sql, params = ()):
+        return self.con.cursor().execute(sql, list(params)).df()
+
+    def rows(self, **filters):
+        """The rows matching filters as a DataFrame with the compact schema and the original index labels."""
+        where, params = _where(filters)
+        df = self.df(f"SELECT * FROM olympics{where} ORDER BY __index__", params)
+        df = apply_schema(df.set_index("__index__"))
+        df.index.name = None
+        return df
+
+    def games(self):
+        return self.df('SELECT DISTINCT "Games" FROM olympics WHERE "Games" IS NOT NULL')["Games"].tolist()
+
+    def last_index(self):
+        return self.df("SELECT max(__index__) AS last FROM olympics")["last"].iloc[0]
+
+    def athlete_keys(self, hashes):
+        """Athlete keys for a Series of Hash_Names: the stored key for athletes already in the files,
+        new keys after the largest one for the rest."""
+        unique = hashes.astype(str).unique().tolist()
+        where, params = _where({"Hash_Names": unique})
+        known = self.df(f'SELECT DISTINCT "Hash_Names", "Athlete" FROM olympics{where}', params)
+        keys = dict(zip(known["Hash_Names"], known["Athlete"]))
+        last = self.df('SELECT max("Athlete") AS last FROM olympics')["last"].iloc[0]
+        start = 0 if pd.isna(last) else int(last) + 1
+        keys.update((h, start + i) for i, h in enumerate(h for h in unique if h not in keys))
+        return hashes.astype(str).map(keys).to_numpy(dtype = "int32")
+
+
+class DuckDBPartitions:
+    """PartitionIndex.get for one key column, as a query."""
+
+    def __init__(self, db, by):
+        self.db = db
+        self.by = by
+
+    def keys(self):
+        return self.db.df(f'SELECT DISTINCT "{self.by}" FROM olympics ORDER BY "{self.by}"')[self.by].tolist()
+
+    def get(self, key):
+        return self.db.rows(**{self.by: key})
+
+    def select(self, key):
+        return Rows(self.get(key))
+
+
+class DuckDBCountries(CountryIndex):
+    """CountryIndex with the NOC groups read from DuckDB and the subsets queried instead of sliced."""
+
+    def __init__(self, db):
+        self.db = db
+        pairs = db.df('SELECT DISTINCT region, "NOC" FROM olympics WHERE region IS NOT NULL ORDER BY region, "NOC"')
+        self.groups = {region: list(nocs) for region, nocs in pairs.groupby("region", sort = False)["NOC"]}
+        self.regions = {noc: region for region, nocs in self.groups.items() for noc in nocs}
+
+    def get(self, country, sport = None):
+        filters = {"NOC": self.nocs(country)}
+        if sport is not None:
+            filters["Sport"] = sport
+        return self.db.rows(**filters)
+
+    def select(self, country, sport = None):
+        return Rows(self.get(country, sport))
+
+
+class DuckDBCube:
+    """MedalCube.select, query and total as GROUP BY queries over the medal rows, count = "event" over the events view."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _from(self, count, filters):
+        if count not in COUNTS:
+            raise ValueError(f"count must be one of {', '.join(COUNTS)}, not {count!r}")
+        columns = CUBE_KEYS if count == "athlete" else EVENT_KEYS + EVENT_COLUMNS
+        for col in filters:
+            if col not in columns:
+                raise ValueError(f"{col} can not be used with count = {count!r}")
+        where, params = _where(filters, medals_only = count == "athlete")
+        return ("olympics" if count == "athlete" else "events") + where, params
+
+    def select(self, count = "athlete", **filters):
+        source, params = self._from(count, filters)
+        if count == "event":
+            return apply_schema(self.db.df(f"SELECT * FROM {source}", params))
+        keys = _columns(CUBE_KEYS)
+        return _keys_schema(self.db.df(f'SELECT {keys}, count(*) AS "Count" FROM {source} GROUP BY {keys} ORDER BY {keys}', params), CUBE_KEYS)
+
+    def query(self, by, name = "Count", count = "athlete", **filters):
+        by = [by] if isinstance(by, str) else list(by)
+        source, params = self._from(count, filters)
+        keys = _columns(by)
+        # Sorterat på nycklarna som en groupby, pandas kategorier är sorterade på samma sätt.
+        df = self.db.df(f'SELECT {keys}, count(*) AS "{name}" FROM {source} GROUP BY {keys} ORDER BY {keys}', params)
+        return _keys_schema(df, by)
+
+    def total(self, count = "athlete", **filters):
+        source, params = self._from(count, filters)
+        return int(self.db.df(f"SELECT count(*) AS n FROM {source}", params)["n"].iloc[0])
+
+
+def year_counts(db):
+    """A YearCounts built from the per year counts that DuckDB groups, without reading the rows."""
+    keys = _columns(PREFIX_KEYS + ["Year"])
+    cells = db.df(f'SELECT {keys}, count(*) AS "Count" FROM olympics GROUP BY {keys} ORDER BY {keys}')
+    return YearCounts(None, _keys_schema(cells, PREFIX_KEYS + ["Year"]))
+
+
+class DuckDBDataset:
+    """The dataset.Dataset interface answered by DuckDB. olympics is None, the full table never is in memory;
+    germany_all and germany are loaded since they are small."""
+
+    def __init__(self, directory = PARQUET_DIR):
+        self.db = DuckDBQuery(directory)
+        self.olympics = None
+        self.germany_all = self.db.rows(NOC = GERMAN_NOCS)
+        self.germany = self.germany_all[self.germany_all["NOC"] == "GER"].copy()
+        self.sport_index = DuckDBPartitions(self.db, "Sport")
+        self.country_index = DuckDBCountries(self.db)
+        self.medal_cube = DuckDBCube(self.db)
+        self.year_counts = year_counts(self.db)
+
+    def append(self, delta):
+        """Writes the rows of delta (from load_data.read_delta) as a new Parquet file and returns a DuckDBDataset
+        that includes it. The file stays in the directory, so the rows are part of every later start.
+        Raises ValueError when delta has rows of Games that are already in the files."""
+        check_new_games(delta, self.db.games())
+        last = self.db.last_index()
+        start = 0 if pd.isna(last) else int(last) + 1
+        delta = delta.set_axis(pd.RangeIndex(start, start + len(delta)))
+        # Deltans egna nycklar gäller bara inom deltan.
+        delta["Athlete"] = self.db.athlete_keys(delta["Hash_Names"])
+        count = len([name for name in os.listdir(self.db.directory) if name.endswith(".parquet")])
+        export_parquet(delta, self.db.directory, f"olympics-{count:05d}")
+        return DuckDBDataset(self.db.directory)
+
+
+if __name__ == "__main__":
+    import argparse
+    from load_data import load_and_clean_data
+    parser = argparse.ArgumentParser(description = "Exports the cleaned data as Parquet for OS_BACKEND=duckdb.")
+    parser.add_argument("--export", action = "store_true", help = f"write the cleaned data to {PARQUET_DIR}")
+    args = parser.parse_args()
+
+    if args.export:
+        olympics, _, _ = load_and_clean_data()
+        print(f"{len(olympics)} rows written to {export_parquet(olympics)}")
+    else:
+        parser.print_help()
@@ -0,0 +1,249 @@
+"""Scaling benchmark for every chart builder in Functions.py and the per-graph callbacks in main.py.
+
+Runs on synthetic data shaped like athlete_events.csv at several multiples of the real row count and reports,
+per function, the pandas work, the Plotly figure construction and the JSON serialization separately.
+
+    python benchmark.py                      # 1x, 10x and 100x, prints a table
+    python benchmark.py --scales 1 10 --save # writes bench_baseline.json
+    python benchmark.py --check              # compares with bench_baseline.json, exit code 1 on a slowdown
+"""
+import os
+import sys
+import json
+import time
+import inspect
+import argparse
+import hashlib
+import numpy as np
+import pandas as pd
+import Functions
+import binning
+import fastfig
+import dataset
+from load_data import NOC_FILE, apply_schema, germany_subsets
+
+REAL_ROWS = 271_116
+BASELINE_FILE = "bench_baseline.json"
+SPORT = "Swimming"
+
+SPORTS = ["Athletics", "Gymnastics", "Swimming", "Shooting", "Cycling", "Fencing", "Rowing", "Cross Country Skiing",
+          "Alpine Skiing", "Wrestling", "Football", "Sailing", "Equestrianism", "Canoeing", "Boxing", "Speed Skating",
+          "Ice Hockey", "Hockey", "Biathlon", "Basketball", "Weightlifting", "Judo", "Water Polo", "Handball",
+          "Ski Jumping", "Bobsleigh", "Volleyball", "Tennis", "Figure Skating", "Diving", "Luge", "Archery"]
+GAMES = [(year, "Summer") for year in range(1896, 2017, 4) if year not in (1916, 1940, 1944)] + \
+        [(year, "Winter") for year in range(1924, 1993, 4) if year not in (1940, 1944)] + \
+        [(year, "Winter") for year in range(1994, 2015, 4)]
+
+
+def make_synthetic(scale = 1, seed = 0):
+    """Returns an olympics frame in the compact schema with REAL_ROWS * scale rows and roughly the real
+    distributions: skewed sports and NOCs, athletes appearing about twice, 15% medal rows and missing body measures."""
+    rng = np.random.default_rng(seed)
+    n = int(REAL_ROWS * scale)
+
+    noc = pd.read_csv(NOC_FILE).dropna(subset = ["region"])
+    noc_weights = rng.pareto(1.2, len(noc)) + 0.1
+    noc_weights[noc["NOC"].isin(["GER", "FRG", "GDR"]).to_numpy()] *= 20
+    noc_codes = rng.choice(len(noc), n, p = noc_weights / noc_weights.sum())
+
+    sport_weights = 1 / np.arange(1, len(SPORTS) + 1)
+    sport_codes = rng.choice(len(SPORTS), n, p = sport_weights / sport_weights.sum())
+    event_codes = sport_codes * 10 + rng.integers(0, 10, n)
+    games_codes = rng.integers(0, len(GAMES), n)
+
+    athletes = n // 2
+    athlete_codes = rng.integers(0, athletes, n)
+    names = np.array([f"Athlete {i}" for i in range(athletes)], dtype = object)
+    hashes = np.array([hashlib.sha256(name.encode("utf-8")).hexdigest() for name in names], dtype = object)
+
+    def missing(values, share):
+        return np.where(rng.random(n) < share, np.nan, values)
+
+    medal = rng.choice(4, n, p = [0.853, 0.049, 0.049, 0.049])
+    olympics = pd.DataFrame({
+        "ID": athlete_codes + 1,
+        "Name": pd.Categorical.from_codes(athlete_codes, names),
+        "Sex": np.where(rng.random(n) < 0.27, "F", "M"),
+        "Age": missing(rng.normal(25.5, 6.3, n).clip(10, 97).round(), 0.035),
+        "Height": missing(rng.normal(175, 10.5, n).round(), 0.22),
+        "Weight": missing(rng.normal(70.7, 14.3, n).round(), 0.23),
+        "Team": noc["region"].to_numpy()[noc_codes],
+        "NOC": noc["NOC"].to_numpy()[noc_codes],
+        "Games": pd.Categorical.from_codes(games_codes, [f"{year} {season}" for year, season in GAMES]),
+        "Year": np.array([year for year, _ in GAMES])[games_codes],
+        "Season": np.array([season for _, season in GAMES])[games_codes],
+        "City": rng.choice(["Athina", "Paris", "London", "Berlin", "Oslo", "Calgary"], n),
+        "Sport": pd.Categorical.from_codes(sport_codes, SPORTS),
+        "Event": pd.Categorical.from_codes(event_codes, [f"{sport} Event {i}" for sport in SPORTS for i in range(10)]),
+        "Medal": pd.Categorical.from_codes(medal - 1, ["Gold", "Silver", "Bronze"]),
+        "region": noc["region"].to_numpy()[noc_codes],
+        "notes": noc["notes"].to_numpy()[noc_codes],
+        "Hash_Names": pd.Categorical.from_codes(athlete_codes, hashes),
+        "Athlete": athlete_codes,
+    })
+    return apply_schema(olympics)
+
+
+def _calls(data):
+    """Arguments for every public function in Functions.py, the same calls layout.py and main.py make."""
+    olympics, germany_all, germany = data.olympics, data.germany_all, data.germany
+    return {
+        "top_german_sports": lambda: Functions.top_german_sports(germany),
+        "medals_each_year": lambda: Functions.medals_each_year(olympics, ["GER", "FRG", "GDR"], "German Olympic Medals per Year"),
+        "plot_age_distribution": lambda: Functions.plot_age_distribution(germany),
+        "summer_vs_winter": lambda: Functions.summer_vs_winter(olympics),
+        "sex_dist_all": lambda: Functions.sex_dist_all(olympics),
+        "sex_dist_divided": lambda: Functions.sex_dist_divided(germany_all, [1968, 1972, 1980, 1988]),
+        "medal_distribution_weight_height": lambda: Functions.medal_distribution_weight_height(olympics, sport = SPORT),
+        "age_dist_per_sex": lambda: Functions.age_dist_per_sex(olympics, germany, "Germany", SPORT),
+        "plot_efficiency": lambda: Functions.plot_efficiency(olympics, germany, "Germany", SPORT),
+        "medal_distribution": lambda: Functions.medal_distribution(olympics, SPORT),
+        "stats_for_country": lambda: Functions.stats_for_country(olympics, "Germany"),
+        "stats_for_sport": lambda: Functions.stats_for_sport(olympics, SPORT),
+        "plot_participants": lambda: Functions.plot_participants(germany_all),
+        "medal_e_v_ger": lambda: Functions.medal_e_v_ger(olympics[olympics["NOC"] == "GDR"], olympics[olympics["NOC"] == "FRG"]),
+        "sex_biat": lambda: Functions.sex_biat(olympics, SPORT),
+    }
+
+
+class _NullPlotly:
+    """Stands in for px, go, make_subplots and fastfig while timing the pandas part: every attribute, call and
+    iteration is a no-op, so only the DataFrame work is left."""
+
+    def __getattr__(self, name):
+        return self
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __iter__(self):
+        return iter(())
+
+
+# Moduler och namn som bygger Plotly-objekt och byts ut när pandas-delen tidsätts.
+PLOTLY_NAMES = [(Functions, "px"), (Functions, "go"), (Functions, "make_subplots"), (Functions, "fastfig"), (binning, "fastfig")]
+
+
+def _without_plotly(func):
+    saved = [(module, name, getattr(module, name)) for module, name in PLOTLY_NAMES]
+    for module, name, _ in saved:
+        setattr(module, name, _NullPlotly())
+    try:
+        return func()
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
+
+
+def _figures(result):
+    """The figures in a return value, which is a figure, (figure, DataFrame) or a tuple of figures.
+    A figure is a go.Figure or a dict from fastfig."""
+    items = result if isinstance(result, (tuple, list)) else [result]
+    return [item for item in items if hasattr(item, "to_plotly_json") or isinstance(item, dict)]
+
+
+def _best(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def time_call(func, repeat = 3):
+    """Returns compute, figure, serialize and total seconds (best of repeat) for one chart builder."""
+    compute, _ = _best(lambda: _without_plotly(func), repeat)
+    total, result = _best(func, repeat)
+    serialize, _ = _best(lambda: [fastfig.to_json(fig) for fig in _figures(result)], repeat)
+    return {
+        "compute": compute,
+        "figure": max(total - compute, 0.0),
+        "serialize": serialize,
+        "total": total + serialize,
+    }
+
+
+def run(scales, repeat = 3, only = None):
+    # Ingen uppvärmning av riktig data, benchmarken installerar sin egen Dataset.
+    os.environ["OS_LAZY"] = "1"
+    import main as app
+    # Utan figurcachen, så att varje anrop räknar.
+    graphs = {callback.__name__: inspect.unwrap(callback) for callback in app.GRAPHS.values()}
+
+    public = {name for name, func in inspect.getmembers(Functions, inspect.isfunction)
+              if func.__module__ == "Functions" and not name.startswith("_")}
+    results = {}
+    for scale in scales:
+        olympics = make_synthetic(scale)
+        data = dataset.Dataset(olympics, *germany_subsets(olympics))
+        dataset.set_dataset(data)
+
+        calls = _calls(data)
+        missing = public - set(calls)
+        if missing:
+            print(f"Varning: inga benchmark-anrop för {', '.join(sorted(missing))}", file = sys.stderr)
+        for name, callback in graphs.items():
+            calls[name] = lambda callback = callback: callback(SPORT)
+        # Alla sex graferna efter varandra, som när allt var en callback.
+        calls["update_graphs"] = lambda: [callback(SPORT) for callback in graphs.values()]
+
+        key = f"{scale}x"
+        results[key] = {"rows": len(olympics)}
+        for name, func in calls.items():
+            if only and name not in only:
+                continue
+            results[key][name] = time_call(func, repeat)
+            print(_format_row(key, name, results[key][name]), flush = True)
+    return results
+
+
+def _format_row(scale, name, timing):
+    return (f"{scale:>5} {name:<34}" + "".join(f"{timing[part] * 1000:>11.1f}" for part in ("compute", "figure", "serialize", "total")))
+
+
+def check(results, baseline, tolerance = 1.5, min_seconds = 0.005):
+    """Returns (scale, name, before, after) for every function whose total time grew by more than tolerance times.
+    Timings under min_seconds are ignored since they are mostly noise."""
+    regressions = []
+    for scale, functions in results.items():
+        for name, timing in functions.items():
+            if name == "rows":
+                continue
+            before = baseline.get("results", {}).get(scale, {}).get(name)
+            if before and timing["total"] > max(before["total"], min_seconds) * tolerance:
+                regressions.append((scale, name, before["total"], timing["total"]))
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type = float, nargs = "+", default = [1, 10, 100])
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--only", nargs = "+", help = "time only these functions")
+    parser.add_argument("--save", action = "store_true", help = f"write the results to {BASELINE_FILE}")
+    parser.add_argument("--check", action = "store_true", help = f"compare with {BASELINE_FILE}")
+    parser.add_argument("--tolerance", type = float, default = 1.5)
+    args = parser.parse_args(argv)
+
+    scales = [int(s) if float(s).is_integer() else s for s in args.scales]
+    print(f"{'scale':>5} {'function':<34}{'compute ms':>11}{'figure ms':>11}{'json ms':>11}{'total ms':>11}")
+    results = run(scales, args.repeat, args.only)
+
+    if args.save:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump({"results": results}, f, indent = 2)
+    if args.check:
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+        regressions = check(results, baseline, args.tolerance)
+        for scale, name, before, after in regressions:
+            print(f"LÅNGSAMMARE: {scale} {name} {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+CUBE_KEYS = ["NOC", "Team", "Sport", "Year", "Season", "Sex", "Medal"]
+# En lagmedalj delas ut till flera idrottare men är en medalj per lag och gren.
+EVENT_KEYS = ["Games", "Event", "NOC", "Medal"]
+EVENT_COLUMNS = ["Year", "Season", "Sport", "Team"]
+COUNTS = ("athlete", "event")
+
+
+def _events(df):
+    """One row per (Games, Event, NOC, Medal) among the medal rows of df, with Year, Season, Sport and Team of its
+    first athlete row and the number of athlete rows in Athletes. Also returns, for every row of df, the position
+    of its event medal, or -1 for rows without a medal."""
+    medal_rows = np.flatnonzero(df["Medal"].notna().to_numpy())
+    medals = df.take(medal_rows)
+    groups = medals.groupby(EVENT_KEYS, observed = True)
+    events = groups[EVENT_COLUMNS].first()
+    events["Athletes"] = groups.size()
+    events = events.reset_index()
+
+    event_of = np.full(len(df), -1, dtype = np.int32)
+    event_of[medal_rows] = groups.ngroup().to_numpy()
+    return events, event_of
+
+
+class MedalCube:
+    """Medal counts per NOC x Team x Sport x Year x Season x Sex x Medal, built once from the athlete rows.
+    Every medal chart that only counts medal rows can be answered by query() instead of scanning the full table.
+
+    Next to the cells it keeps events, one row per medal won in an event (Games, Event, NOC, Medal), and event_of,
+    the event medal of every athlete row. query(count = "event") counts a team medal once, count = "athlete" once
+    per athlete on the team."""
+
+    def __init__(self, df, cells = None, events = None, event_of = None):
+        if cells is None:
+            medals = df[df["Medal"].notna()]
+            cells = medals.groupby(CUBE_KEYS, observed = True).size().reset_index(name = "Count")
+        self.cells = cells
+        if events is None:
+            events, event_of = _events(df)
+        self.events = events
+        self.event_of = event_of
+
+    def extended(self, df, start):
+        """Returns the cube for df, whose first start rows are the rows this cube was built from. Only the new rows
+        are counted, their cells and event medals are added to the existing ones."""
+        dtypes = {col: df[col].dtype for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)}
+        new = MedalCube(df.iloc[start:])
+        cells = pd.concat([self.cells.astype({col: dtypes[col] for col in CUBE_KEYS if col in dtypes}), new.cells])
+        cells = cells.groupby(CUBE_KEYS, observed = True)["Count"].sum().reset_index()
+
+        # Nya rader kan höra till en medalj som redan finns (t.ex. en rättad lagmedalj), därför slås tabellerna ihop på nyckeln.
+        old_events = self.events.astype({col: dtypes[col] for col in self.events.columns if col in dtypes})
+        events = pd.concat([old_events, new.events], ignore_index = True)
+        groups = events.groupby(EVENT_KEYS, observed = True)
+        position = groups.ngroup().to_numpy()
+        merged = groups[EVENT_COLUMNS].first()
+        merged["Athletes"] = groups["Athletes"].sum()
+
+        old_position, new_position = position[:len(self.events)], position[len(self.events):]
+        event_of = np.concatenate([np.where(self.event_of >= 0, old_position[self.event_of], -1),
+                                   np.where(new.event_of >= 0, new_position[new.event_of], -1)]).astype(np.int32)
+        return MedalCube(df, cells, merged.reset_index(), event_of)
+
+    def select(self, count = "athlete", **filters):
+        """Returns the cells (or with count = "event" the event medals) matching filters. A filter value is either
+        a single value or a list of values, e.g. select(Sport = "Swimming", NOC = ["GER", "FRG", "GDR"])."""
+        if count not in COUNTS:
+            raise ValueError(f"count must be one of {', '.join(COUNTS)}, not {count!r}")
+        cells = self.cells if count == "athlete" else self.events
+        for col, value in filters.items():
+            if col not in cells.columns:
+                raise ValueError(f"{col} can not be used with count = {count!r}")
+            if isinstance(value, (list, tuple, set)):
+                cells = cells[cells[col].isin(value)]
+            else:
+                cells = cells[cells[col] == value]
+        return cells
+
+    def query(self, by, name = "Count", count = "athlete", **filters):
+        """Rolls the cells matching filters up to the columns in by and returns a DataFrame with
+        the by columns and the medal count in a column called name, ordered like a groupby on the rows.
+        count = "event" counts every medal won in an event once, however many athletes shared it."""
+        cells = self.select(count, **filters)
+        if count == "event":
+            return cells.groupby(by, observed = True).size().reset_index(name = name)
+        return cells.groupby(by, observed = True)["Count"].sum().reset_index(name = name)
+
+    def total(self, count = "athlete", **filters):
+        cells = self.select(count, **filters)
+        return len(cells) if count == "event" else int(cells["Count"].sum())
+
+
+# Alla idrottsrader räknas, inte bara medaljer, så Medal kan vara NaN i en nyckel.
+PREFIX_KEYS = ["NOC", "Sport", "Sex", "Medal"]
+
+
+class YearCounts:
+    """Athlete rows per NOC x Sport x Sex x Medal as cumulative counts over the years, so the number of rows for
+    any year range is the difference of two columns, cumulative[:, end] - cumulative[:, start], one subtraction
+    per key whatever the range is. Built once from the rows, like MedalCube."""
+
+    def __init__(self, df, cells = None):
+        if cells is None:
+            cells = df.groupby(PREFIX_KEYS + ["Year"], observed = True, dropna = False).size().reset_index(name = "Count")
+        self.cells = cells
+
+        key = cells.groupby(PREFIX_KEYS, observed = True, dropna = False, sort = False).ngroup().to_numpy()
+        first = np.unique(key, return_index = True)[1]
+        self.keys = cells[PREFIX_KEYS].iloc[first].reset_index(drop = True)
+        self.years = np.unique(cells["Year"].to_numpy())
+
+        # Kolumn j är antalet rader före years[j], kolumn 0 är alltid 0.
+        counts = np.zeros((len(self.keys), len(self.years) + 1), dtype = np.int64)
+        np.add.at(counts, (key, np.searchsorted(self.years, cells["Year"].to_numpy()) + 1), cells["Count"].to_numpy())
+        self.cumulative = np.cumsum(counts, axis = 1)
+
+    def extended(self, df, start):
+        """Returns the counts for df, whose first start rows are the rows these counts were built from. Only the new
+        rows are grouped, the cumulative counts are then rebuilt from the cells, which do not grow with the rows."""
+        dtypes = {col: df[col].dtype for col in PREFIX_KEYS if isinstance(df[col].dtype, pd.CategoricalDtype)}
+        new = YearCounts(df.iloc[start:])
+        cells = pd.concat([self.cells.astype(dtypes), new.cells.astype(dtypes)])
+        cells = cells.groupby(PREFIX_KEYS + ["Year"], observed = True, dropna = False)["Count"].sum().reset_index()
+        return YearCounts(df, cells)
+
+    def span(self):
+        """The first and last year."""
+        return int(self.years[0]), int(self.years[-1])
+
+    def count(self, start, end, by, **filters):
+        """Number of rows from year start to end (both included) matching filters, summed per by, as a Series.
+        Filters are a value or a list of values per key column, e.g. count(1968, 1988, "Sex", NOC = "FRG")."""
+        lo = np.searchsorted(self.years, start, side = "left")
+        hi = np.searchsorted(self.years, end, side = "right")
+        counts = self.cumulative[:, max(hi, lo)] - self.cumulative[:, lo]
+
+        mask = np.ones(len(self.keys), dtype = bool)
+        for col, value in filters.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= self.keys[col].isin(values).to_numpy()
+        keys = self.keys[mask]
+        by = [by] if isinstance(by, str) else by
+        return pd.Series(counts[mask], index = keys.index, name = "Count").groupby([keys[col] for col in by], observed = True).sum()
@@ -0,0 +1,63 @@
+import threading
+from load_data import load_and_clean_data, append_frames
+from partitions import PartitionIndex, CountryIndex
+from cube import MedalCube, YearCounts
+
+
+class Dataset:
+    """The cleaned frames together with the lookup structures that are built from them once at load time."""
+
+    def __init__(self, olympics, germany_all, germany, sport_index = None, country_index = None, medal_cube = None,
+                 year_counts = None):
+        self.olympics = olympics
+        self.germany_all = germany_all
+        self.germany = germany
+
+        # Radpositioner per sport, så att callbacken bara behöver titta på den valda sportens rader.
+        self.sport_index = PartitionIndex(olympics, "Sport") if sport_index is None else sport_index
+        # Radpositioner per NOC och region (t.ex. Germany = GER, FRG, GDR, SAA), även per sport.
+        self.country_index = CountryIndex(olympics) if country_index is None else country_index
+
+        # Medaljräkningar för alla medaljgrafer.
+        self.medal_cube = MedalCube(olympics) if medal_cube is None else medal_cube
+        # Kumulativa antal per år, för årsintervallen.
+        self.year_counts = YearCounts(olympics) if year_counts is None else year_counts
+
+    def append(self, delta):
+        """Returns a new Dataset with the rows of delta (from load_data.read_delta) appended. The indexes and the cube
+        are extended with the new rows instead of being rebuilt, and this Dataset is left unchanged for callbacks
+        that are still using it."""
+        start = len(self.olympics)
+        frames = append_frames((self.olympics, self.germany_all, self.germany), delta)
+        olympics = frames[0]
+        return Dataset(*frames,
+                       sport_index = self.sport_index.extended(olympics, start),
+                       country_index = self.country_index.extended(olympics, start),
+                       medal_cube = self.medal_cube.extended(olympics, start),
+                       year_counts = self.year_counts.extended(olympics, start))
+
+
+_dataset = None
+_lock = threading.Lock()
+
+
+def get_dataset():
+    """Returns the process wide Dataset, loading it on first use. With OS_BACKEND=duckdb it is a
+    backend.DuckDBDataset over the Parquet files instead, with the same interface."""
+    global _dataset
+    if _dataset is None:
+        with _lock:
+            if _dataset is None:
+                import backend
+                if backend.BACKEND == "duckdb":
+                    _dataset = backend.DuckDBDataset()
+                else:
+                    _dataset = Dataset(*load_and_clean_data())
+    return _dataset
+
+
+def set_dataset(data):
+    """Replaces the process wide Dataset, e.g. with synthetic data in benchmarks."""
+    global _dataset
+    with _lock:
+        _dataset = data
@@ -0,0 +1,190 @@
+"""Fast figure construction for the charts that are built on every request.
+
+Plotly's graph objects validate and deep copy every property, which for the small aggregated frames in the sport
+section costs more than the pandas work. Figure builds the same figure JSON as plain dicts and NumPy arrays, with
+the subplot grid, subplot titles and vlines laid out the way make_subplots and add_vline do, and to_json serializes
+it with orjson when it is installed.
+
+Set OS_PLOTLY_FIGURES=1 to get validated go.Figure objects from build() instead, e.g. when debugging a figure.
+"""
+import os
+import json
+import plotly.io as pio
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PLOTLY_FIGURES = os.environ.get("OS_PLOTLY_FIGURES") == "1"
+
+_template = None
+
+
+def template():
+    """The default Plotly template as plain JSON, the layout.template a go.Figure would get."""
+    global _template
+    if _template is None:
+        _template = json.loads(json.dumps(pio.templates[pio.templates.default].to_plotly_json(), cls = PlotlyJSONEncoder))
+    return _template
+
+
+def _set(target, props):
+    """Sets props on a nested dict with Plotly's magic underscores, e.g. xaxis2_title = "Age" or title_x = 0.5.
+    A string set as a title becomes {"text": ...}, like in graph objects."""
+    for key, value in props.items():
+        *path, last = key.split("_")
+        node = target
+        for part in path:
+            node = node.setdefault(part, {})
+        if last == "title" and isinstance(value, str):
+            value = {"text": value}
+        if isinstance(value, dict) and isinstance(node.get(last), dict):
+            _set(node[last], value)
+        else:
+            node[last] = value
+
+
+def trace(type, **props):
+    """A trace dict, e.g. trace("bar", x = ..., y = ..., marker_color = "grey")."""
+    result = {"type": type}
+    _set(result, props)
+    return result
+
+
+def bar(**props):
+    return trace("bar", **props)
+
+
+def _axis_id(axis, index):
+    return axis if index == 1 else f"{axis}{index}"
+
+
+class Figure:
+    """A figure as a dict with the parts of the go.Figure API the chart functions use: add_trace with row and col,
+    update_layout, update_xaxes/update_yaxes, update_traces and add_vline. Create grids with subplots()."""
+
+    def __init__(self, **layout):
+        self.data = []
+        self.layout = {}
+        self.grid = {(1, 1): 1}
+        self.domains = {}
+        _set(self.layout, layout)
+
+    def add_trace(self, trace, row = None, col = None):
+        if (row, col) in self.domains:
+            trace["domain"] = dict(self.domains[(row, col)])
+        elif row is not None:
+            index = self.grid[(row, col)]
+            trace["xaxis"], trace["yaxis"] = _axis_id("x", index), _axis_id("y", index)
+        self.data.append(trace)
+        return self
+
+    def update_layout(self, **props):
+        _set(self.layout, props)
+        return self
+
+    def _update_axes(self, axis, row, col, props):
+        for (r, c), index in self.grid.items():
+            if (row is None or row == r) and (col is None or col == c):
+                _set(self.layout.setdefault(_axis_id(axis, index).replace(axis, f"{axis}axis", 1), {}), props)
+        return self
+
+    def update_xaxes(self, row = None, col = None, **props):
+        return self._update_axes("x", row, col, props)
+
+    def update_yaxes(self, row = None, col = None, **props):
+        return self._update_axes("y", row, col, props)
+
+    def update_traces(self, **props):
+        for trace in self.data:
+            _set(trace, props)
+        return self
+
+    def add_vline(self, x, row = 1, col = 1, line_dash = None, line_color = None, annotation_text = None,
+                  annotation_position = "top right"):
+        """A dashed line over the full height of one subplot with an optional label, like go.Figure.add_vline."""
+        index = self.grid[(row, col)]
+        xref, yref = _axis_id("x", index), _axis_id("y", index) + " domain"
+        line = {}
+        if line_color is not None:
+            line["color"] = line_color
+        if line_dash is not None:
+            line["dash"] = line_dash
+        self.layout.setdefault("shapes", []).append(
+            {"line": line, "type": "line", "x0": x, "x1": x, "xref": xref, "y0": 0, "y1": 1, "yref": yref})
+
+        if annotation_text is not None:
+            # Samma placering som plotly gör för en vlines annotation_position.
+            y, yanchor = (1, "top") if "top" in annotation_position else (0, "bottom") if "bottom" in annotation_position else (0.5, "middle")
+            xanchor = "left" if "right" in annotation_position else "right" if "left" in annotation_position else "center"
+            self.layout.setdefault("annotations", []).append(
+                {"showarrow": False, "text": annotation_text, "x": x, "xanchor": xanchor, "xref": xref,
+                 "y": y, "yanchor": yanchor, "yref": yref})
+        return self
+
+    def to_dict(self):
+        layout = dict(self.layout, template = template())
+        return {"data": self.data, "layout": layout}
+
+    def build(self):
+        """The finished figure: a plain dict, or a validated go.Figure with OS_PLOTLY_FIGURES=1."""
+        if PLOTLY_FIGURES:
+            return go.Figure(self.to_dict())
+        return self.to_dict()
+
+
+def subplots(rows = 1, cols = 1, subplot_titles = None, column_widths = None, shared_yaxes = False, specs = None):
+    """A Figure with a rows x cols grid of xy subplots, with the same domains, axis ids and subplot title
+    annotations as make_subplots with the same arguments. Cells with {"type": "domain"} in specs hold pies,
+    traces added there get the cell as their domain instead of axes."""
+    horizontal_spacing = 0.2 / cols
+    vertical_spacing = (0.5 if subplot_titles else 0.3) / rows
+    column_widths = column_widths or [1] * cols
+    widths = [(1.0 - horizontal_spacing * (cols - 1)) * (w / float(sum(column_widths))) for w in column_widths]
+    heights = [(1.0 - vertical_spacing * (rows - 1)) / rows] * rows
+
+    fig = Figure()
+    fig.grid = {}
+    titles = []
+    for r in range(rows):
+        for c in range(cols):
+            index = r * cols + c + 1
+            x_s = sum(widths[:c]) + c * horizontal_spacing
+            y_s = sum(heights[:rows - 1 - r]) + (rows - 1 - r) * vertical_spacing
+            x_domain = [max(0.0, x_s), min(1.0, x_s + widths[c])]
+            y_domain = [max(0.0, y_s), min(1.0, y_s + heights[-1 - r])]
+
+            if specs and specs[r][c].get("type") == "domain":
+                fig.domains[(r + 1, c + 1)] = {"x": x_domain, "y": y_domain}
+            else:
+                fig.grid[(r + 1, c + 1)] = index
+                x, y = _axis_id("x", index), _axis_id("y", index)
+                fig.layout[x.replace("x", "xaxis", 1)] = {"anchor": y, "domain": x_domain}
+                fig.layout[y.replace("y", "yaxis", 1)] = {"anchor": x, "domain": y_domain}
+                if shared_yaxes and c > 0:
+                    fig.layout[y.replace("y", "yaxis", 1)].update(matches = _axis_id("y", r * cols + 1), showticklabels = False)
+
+            if subplot_titles and index <= len(subplot_titles) and subplot_titles[index - 1]:
+                titles.append({"font": {"size": 16}, "showarrow": False, "text": subplot_titles[index - 1],
+                               "x": sum(x_domain) / 2.0, "xanchor": "center", "xref": "paper",
+                               "y": y_domain[1], "yanchor": "bottom", "yref": "paper"})
+    if titles:
+        fig.layout["annotations"] = titles
+    return fig
+
+
+def _default(obj):
+    # NumPy-skalärer, pandas-objekt och arrayer som orjson inte tar direkt (t.ex. object-arrayer).
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def to_json(fig):
+    """Serializes a figure from build() (or any Plotly figure) to a JSON string."""
+    if isinstance(fig, dict) and orjson is not None:
+        return orjson.dumps(fig, default = _default, option = orjson.OPT_SERIALIZE_NUMPY).decode()
+    return pio.to_json(fig, validate = False)
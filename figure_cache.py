@@ -0,0 +1,106 @@
+import os
+import json
+import functools
+import threading
+from collections import OrderedDict
+import fastfig
+import metrics
+
+DEFAULT_BUDGET_MB = float(os.environ.get("OS_FIGURE_CACHE_MB", 64))
+
+
+def _size(payloads):
+    return sum(len(p) for p in payloads if isinstance(p, (str, bytes)))
+
+
+class FigureCache:
+    """LRU cache of serialized figure JSON keyed on callback inputs. Entries are evicted, least recently used
+    first, as soon as the total size of the stored JSON goes over max_bytes. Every discard starts a new generation,
+    and a memoized figure computed during an older generation is not stored."""
+
+    def __init__(self, max_mb = DEFAULT_BUDGET_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            payloads = self.entries.get(key)
+            if payloads is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return payloads
+
+    def put(self, key, payloads, generation = None):
+        """Stores payloads under key. With generation, only when no discard has happened since that generation."""
+        size = _size(payloads)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self.entries:
+                self.size -= _size(self.entries.pop(key))
+            self.entries[key] = payloads
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last = False)
+                self.size -= _size(evicted)
+
+    def discard(self, match):
+        """Removes every entry whose key matches, e.g. discard(lambda key: key[1] in sports). Keys are
+        (callback name,) + the callback arguments."""
+        with self.lock:
+            # En callback som började på den gamla datan får inte lägga tillbaka sin figur efteråt.
+            self.generation += 1
+            for key in [key for key in self.entries if match(key)]:
+                self.size -= _size(self.entries.pop(key))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def memoize(self, func):
+        """Wraps a callback that returns one figure or a tuple of figures. The figures are stored as JSON,
+        so a cache hit only has to parse JSON and never touches pandas or Plotly."""
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            # Dash skickar listor (t.ex. från en RangeSlider), som måste göras hashbara.
+            key = (func.__name__,) + tuple(tuple(a) if isinstance(a, list) else a for a in args)
+            payloads = self.get(key)
+            if payloads is None:
+                generation = self.generation
+                result = func(*args)
+                many = isinstance(result, (tuple, list))
+                figures = result if many else (result,)
+                t = metrics.laps(func.__name__)
+                payloads = tuple(fastfig.to_json(fig) for fig in figures)
+                t.lap("serialize")
+                self.put(key, (many,) + payloads, generation)
+            else:
+                t = metrics.laps(func.__name__)
+                many, *payloads = payloads
+                result = [json.loads(p) for p in payloads]
+                result = result if many else result[0]
+                t.lap("cache_hit")
+            if metrics.ENABLED:
+                for i, payload in enumerate(payloads):
+                    metrics.record_payload(func.__name__, str(i), len(payload))
+            return result
+
+        wrapper.cache = self
+        return wrapper
+
+
+def warm_up(callback, values):
+    """Runs a memoized callback once for every value, e.g. every option in a dropdown, so the first users hit a warm cache."""
+    for value in values:
+        callback(value)
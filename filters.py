@@ -0,0 +1,104 @@
+"""Lazy row filters over a DataFrame, without full-width copies.
+
+Rows(df) stands for a set of rows of df, all of them or the positions from an index (PartitionIndex.select).
+where(), between() and notna() only collect predicates. They are evaluated together in one pass over the candidate
+positions, on the category codes and NumPy arrays behind the columns, so no boolean Series over the whole
+frame and no filtered copy of every column is made. frame() and column() then copy only the columns that
+are asked for.
+
+    rows = Rows(olympics).where(Sport = "Swimming").notna("Medal")
+    medals = rows.frame("NOC", "Medal")
+"""
+import numpy as np
+import pandas as pd
+
+
+def _values(value):
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+def _matches(col, positions, values):
+    """Boolean array, for every position, whether col has one of values."""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        codes = col.cat.codes.to_numpy()
+        targets = col.cat.categories.get_indexer(values)
+        targets = targets[targets >= 0]
+        codes = codes if positions is None else codes[positions]
+        return codes == targets[0] if len(targets) == 1 else np.isin(codes, targets)
+    array = col.to_numpy() if positions is None else col.to_numpy()[positions]
+    return array == values[0] if len(values) == 1 else np.isin(array, values)
+
+
+def _between(col, positions, bounds):
+    array = col.to_numpy() if positions is None else col.to_numpy()[positions]
+    return (array >= bounds[0]) & (array <= bounds[1])
+
+
+def _present(col, positions):
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        codes = col.cat.codes.to_numpy()
+        return (codes if positions is None else codes[positions]) >= 0
+    values = col.array if positions is None else col.array.take(positions)
+    return ~np.asarray(pd.isna(values))
+
+
+class Rows:
+    """Rows of df at positions (None for every row), narrowed by predicates that are evaluated lazily."""
+
+    def __init__(self, df, positions = None, predicates = ()):
+        self.df = df
+        self._positions = positions
+        self.predicates = tuple(predicates)
+
+    @property
+    def columns(self):
+        return self.df.columns
+
+    def where(self, **conditions):
+        """Keeps the rows where every column equals its value, or one of its values for a list,
+        e.g. where(Sport = "Swimming", NOC = ["FRG", "GDR"])."""
+        return Rows(self.df, self._positions, self.predicates + tuple(("in", col, _values(value)) for col, value in conditions.items()))
+
+    def between(self, column, low, high):
+        """Keeps the rows where a numeric column is from low to high, both included, e.g. between("Year", 1968, 1988)."""
+        return Rows(self.df, self._positions, self.predicates + (("between", column, (low, high)),))
+
+    def notna(self, *columns):
+        """Keeps the rows where none of columns is missing."""
+        return Rows(self.df, self._positions, self.predicates + tuple(("notna", col, None) for col in columns))
+
+    def positions(self):
+        """Evaluates the predicates in one pass and returns the row positions, or None for every row."""
+        if self.predicates:
+            keep = None
+            for kind, col, values in self.predicates:
+                if kind == "in":
+                    part = _matches(self.df[col], self._positions, values)
+                elif kind == "between":
+                    part = _between(self.df[col], self._positions, values)
+                else:
+                    part = _present(self.df[col], self._positions)
+                keep = part if keep is None else keep & part
+            candidates = np.arange(len(self.df)) if self._positions is None else self._positions
+            self._positions, self.predicates = candidates[keep], ()
+        return self._positions
+
+    def __len__(self):
+        positions = self.positions()
+        return len(self.df) if positions is None else len(positions)
+
+    def frame(self, *columns):
+        """The rows as a DataFrame with only columns (every column when none are given), with the index labels of df."""
+        df = self.df[list(columns)] if columns else self.df
+        positions = self.positions()
+        return df if positions is None else df.take(positions)
+
+    def column(self, name):
+        """One column of the rows as a Series."""
+        positions = self.positions()
+        return self.df[name] if positions is None else self.df[name].take(positions)
+
+
+def as_rows(df):
+    """Rows over a DataFrame, or df itself when it already is Rows."""
+    return df if isinstance(df, Rows) else Rows(df)
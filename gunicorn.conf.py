@@ -0,0 +1,23 @@
+# Kör med: gunicorn main:server
+#
+# Datan laddas en gång i master-processen innan workers forkas. Alla workers delar då samma
+# minnessidor (copy-on-write), så minnet per worker växer inte med antalet workers.
+import os
+import gc
+
+# Uppvärmningen körs synkront i when_ready, en bakgrundstråd får inte vara igång när master forkar.
+os.environ.setdefault("OS_LAZY", "1")
+
+preload_app = True
+# Varje graf i sportsektionen är en egen callback och webbläsaren skickar sex anrop samtidigt,
+# med flera trådar per worker räknas de ut parallellt i stället för i kö.
+threads = int(os.environ.get("OS_THREADS", 6))
+
+
+def when_ready(server):
+    import main
+    main.start_warm_up(background = False)
+    # Flyttar alla objekt som finns nu till en permanent generation, så att workers skräpsamlare inte
+    # skriver till dem och därmed kopierar de delade sidorna.
+    gc.freeze()
+    server.log.info("Dataset loaded in master, forking workers")
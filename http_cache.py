@@ -0,0 +1,93 @@
+"""Compression and HTTP validators for the responses of main.server.
+
+Every JSON, HTML, JS or CSS response over OS_COMPRESS_MIN_BYTES (default 1024) is sent gzip compressed, or brotli
+compressed when the brotli package is installed and the browser accepts it. The compressed bodies are kept in an
+LRU cache keyed on the hash of the body (OS_COMPRESS_CACHE_MB, default 32), so the same figures for the same
+dropdown selection, the layout and the Dash JS bundles are only compressed once.
+
+GET responses without validators of their own (the page, /_dash-layout and /_dash-dependencies) get a weak ETag
+and Cache-Control: public, no-cache. Browsers and shared caches may keep them but revalidate on every load, and
+an unchanged layout is answered with 304 Not Modified. Callback responses are POSTs, which HTTP caches do not store,
+so they are only compressed.
+
+Set OS_COMPRESS=0 to turn compression off, e.g. behind a proxy that already compresses.
+"""
+import os
+import gzip
+import hashlib
+from flask import request
+from figure_cache import FigureCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENABLED = os.environ.get("OS_COMPRESS") != "0"
+MIN_BYTES = int(os.environ.get("OS_COMPRESS_MIN_BYTES", 1024))
+LEVEL = int(os.environ.get("OS_COMPRESS_LEVEL", 6))
+CACHE_MB = float(os.environ.get("OS_COMPRESS_CACHE_MB", 32))
+COMPRESSIBLE = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+compressed_cache = FigureCache(CACHE_MB)
+
+
+def _encoding():
+    """The best encoding the client accepts, or None."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality = min(LEVEL, 11))
+    # mtime = 0 så att samma kropp alltid ger samma bytes.
+    return gzip.compress(body, compresslevel = LEVEL, mtime = 0)
+
+
+def _validate(response, body):
+    if response.get_etag()[0] is None:
+        response.set_etag(hashlib.sha1(body).hexdigest(), weak = True)
+    if "Cache-Control" not in response.headers:
+        response.headers["Cache-Control"] = "public, no-cache"
+    return response.make_conditional(request)
+
+
+def _compress(response, body):
+    encoding = _encoding()
+    if encoding is None:
+        return response
+    key = (hashlib.sha1(body).digest(), encoding)
+    cached = compressed_cache.get(key)
+    if cached is None:
+        cached = (False, compress(body, encoding))
+        compressed_cache.put(key, cached)
+    response.set_data(cached[1])
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def after_request(response):
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+        return response
+    if not response.mimetype.startswith(COMPRESSIBLE) or "Content-Encoding" in response.headers:
+        return response
+    body = response.get_data()
+    if request.method in ("GET", "HEAD"):
+        response = _validate(response, body)
+        if response.status_code == 304:
+            return response
+    response.vary.add("Accept-Encoding")
+    if ENABLED and len(body) >= MIN_BYTES:
+        response = _compress(response, body)
+    return response
+
+
+def install(server):
+    """Adds compression and validators to every response of a Flask server."""
+    server.after_request(after_request)
+    return server
@@ -1,59 +1,160 @@
+import os
+import threading
 from dash import html, dcc
-import pandas as pd
 import Functions
-from load_data import load_and_clean_data
-
-olympics, germany_all, germany = load_and_clean_data()
-
-fig1, _ = Functions.top_german_sports(germany)
-fig2, _ = Functions.medals_each_year(olympics, ["GER", "FRG", "GDR"], "German Olympic Medals per Year")
-fig3, _ = Functions.plot_participants(germany_all)
-fig4 = Functions.plot_age_distribution(germany)
-fig5, _ = Functions.summer_vs_winter(olympics)
-fig6 = Functions.sex_dist_divided(germany_all, [1968, 1972, 1980, 1988])
-fig7 = Functions.sex_dist_all(olympics)
-fig8 = Functions.medal_e_v_ger(olympics[olympics["NOC"] == "GDR"], olympics[olympics["NOC"] == "FRG"])
-fig9 = Functions.plot_efficiency(olympics, germany, "Germany", "Ski Jumping")
-fig10 = Functions.medal_distribution(olympics, "Ski Jumping")
-fig11 = Functions.age_dist_per_sex(olympics, germany, "Germany", "Ski Jumping")
-fig12, _ = Functions.stats_for_sport(olympics, "Ski Jumping")
-fig13, _ = Functions.medal_distribution_weight_height(olympics, sport = "Ski Jumping")
-fig14 = Functions.sex_biat(olympics)
-
-
-layout = html.Div([
-    html.H1("Germany Olympic Performance Dashboard", style = {"textAlign": "center", "fontFamily": "Helvetica", "color": "black"}),
-
-    html.H2("Uppgift 1 - Landstatistik", style = {"fontFamily": "Helvetica", "color": "black"}),
-
-    dcc.Graph(figure = fig1),
-    dcc.Graph(figure = fig2),
-    dcc.Graph(figure = fig3),
-    dcc.Graph(figure = fig4),
-    dcc.Graph(figure = fig5),
-    dcc.Graph(figure = fig6),
-    dcc.Graph(figure = fig7),
-    dcc.Graph(figure = fig8),
-
-    html.H2("Uppgift 2 - Sportstatistik", style = {"fontFamily": "Helvetica", "color": "black"}),
-
-    dcc.Dropdown(
-        id = "sport-dropdown",
-        options = [
-            {"label": "Ski Jumping", "value": "Ski Jumping"},
-            {"label": "Swimming", "value": "Swimming"},
-            {"label": "Biathlon", "value": "Biathlon"},
-            {"label": "Football", "value": "Football"},
-        ],
-        value = "Ski Jumping",
-        clearable = False,
-        style = {"width": "50%", "margin": "20px auto"}
-    ),
-
-    dcc.Graph(id = "efficiency-graph"),
-    dcc.Graph(id = "medal-dist-graph"),
-    dcc.Graph(id = "age-graph"),
-    dcc.Graph(id = "sport-stats-graph"),
-    dcc.Graph(id = "weight-height-graph"),
-    dcc.Graph(id = "gender-and-age"),
-])
\ No newline at end of file
+from dataset import get_dataset
+
+SPORTS = ["Ski Jumping", "Swimming", "Biathlon", "Football"]
+DEFAULT_COUNTRY = "GER"
+#OS_CLIENTSIDE=1: alla sporters figurer för valt land skickas till webbläsaren, som byter sport utan att fråga servern.
+CLIENTSIDE = os.environ.get("OS_CLIENTSIDE") == "1"
+#OS_PARTICIPANT_ERROR=0.01: deltagarantalet skattas med HyperLogLog med det relativa felet, för mycket stora dataset.
+PARTICIPANT_ERROR = float(os.environ["OS_PARTICIPANT_ERROR"]) if os.environ.get("OS_PARTICIPANT_ERROR") else None
+
+#Namn på figurerna från static_figures, i samma ordning (filnamn i report.py).
+STATIC_NAMES = ["top_german_sports", "medals_each_year", "plot_participants", "plot_age_distribution",
+                "summer_vs_winter", "sex_dist_divided", "sex_dist_all", "medal_e_v_ger"]
+#Medaljgraferna som följer årsreglaget, namn -> graf-id, i samma ordning som medal_range_figures.
+RANGE_GRAPHS = {"medals_each_year": "medals-year-graph", "summer_vs_winter": "season-graph", "medal_e_v_ger": "east-west-graph"}
+
+_figures = None
+_lock = threading.Lock()
+ready = threading.Event()
+_warming = False
+
+
+def static_figures():
+    """Builds the figures in the country section on first use and returns the same list on every later call.
+    Without a warm-up (OS_LAZY=1) this sets ready, the app is warm once the figures are built."""
+    global _figures
+    if _figures is None:
+        with _lock:
+            if _figures is None:
+                data = get_dataset()
+                germany_all, germany = data.germany_all, data.germany
+
+                fig1, _ = Functions.top_german_sports(germany, cube = data.medal_cube)
+                fig2, fig5, fig8 = medal_range_figures()
+                fig3, _ = Functions.plot_participants(germany_all, PARTICIPANT_ERROR)
+                fig4 = Functions.plot_age_distribution(germany)
+                fig6 = Functions.sex_dist_divided(germany_all, [1968, 1972, 1980, 1988], counts = data.year_counts)
+                fig7 = Functions.sex_dist_all(germany_all, counts = data.year_counts)
+
+                _figures = [fig1, fig2, fig3, fig4, fig5, fig6, fig7, fig8]
+    # Under uppvärmningen sätter warm_up ready först när figurcachen också är varm.
+    if not _warming:
+        ready.set()
+    return _figures
+
+
+def medal_range_figures(years = None):
+    """The medal charts of the country section that follow the year slider (medals per year, summer vs winter and
+    East vs West Germany) for years = (start, end), or for every year."""
+    data = get_dataset()
+    cube = data.medal_cube
+    fig2, _ = Functions.medals_each_year(data.olympics, ["GER", "FRG", "GDR"], "German Olympic Medals per Year", cube = cube, years = years)
+    fig5, _ = Functions.summer_vs_winter(data.olympics, cube = cube, years = years)
+    fig8 = Functions.medal_e_v_ger(None, None, cube = cube, years = years)
+    return fig2, fig5, fig8
+
+
+def _static_graph(name, fig):
+    if name in RANGE_GRAPHS:
+        return dcc.Graph(id = RANGE_GRAPHS[name], figure = fig)
+    return dcc.Graph(figure = fig)
+
+
+def reset_static_figures():
+    """Drops the static figures so the next page load builds them from the current Dataset."""
+    global _figures
+    with _lock:
+        _figures = None
+
+
+def build_layout(figures, country_options = None, sport_store = None, years = (1896, 2016)):
+    """Returns the page layout. figures are the static country figures, or None for an empty skeleton
+    with the same component ids that Dash can validate the callbacks against without loading any data.
+    sport_store is the preloaded data of the sport-store in client-side mode, years the first and last year.
+    The year slider starts on every year, the figures of the page are then the unfiltered ones."""
+    figures = figures or [{}] * 8
+    country_options = country_options or [{"label": "Germany (GER)", "value": DEFAULT_COUNTRY}]
+    first, last = years
+
+    return html.Div([
+        html.H1("Germany Olympic Performance Dashboard", style = {"textAlign": "center", "fontFamily": "Helvetica", "color": "black"}),
+
+        #Årsreglaget gäller hela sidan: medaljgraferna, könsfördelningen och de sex sportgraferna.
+        #drag_value ändras för varje rörelse och driver bara könsfördelningen (två differenser per nyckel i YearCounts),
+        #value ändras när reglaget släpps och driver de andra graferna.
+        html.H3("Years", style = {"fontFamily": "Helvetica", "color": "black"}),
+        dcc.RangeSlider(
+            id = "year-slider",
+            min = first,
+            max = last,
+            step = 1,
+            value = [first, last],
+            marks = {year: str(year) for year in range(first - first % 10 + 10, last + 1, 10)},
+            allowCross = False,
+            updatemode = "mouseup",
+            tooltip = {"placement": "bottom"}
+        ),
+
+        html.H2("Uppgift 1 - Landstatistik", style = {"fontFamily": "Helvetica", "color": "black"}),
+
+        *[_static_graph(name, fig) for name, fig in zip(STATIC_NAMES, figures)],
+
+        dcc.Graph(id = "sex-range-graph"),
+
+        html.H2("Uppgift 2 - Sportstatistik", style = {"fontFamily": "Helvetica", "color": "black"}),
+
+        dcc.Dropdown(
+            id = "sport-dropdown",
+            options = [{"label": sport, "value": sport} for sport in SPORTS],
+            value = "Ski Jumping",
+            clearable = False,
+            style = {"width": "50%", "margin": "20px auto"}
+        ),
+
+        dcc.Dropdown(
+            id = "country-dropdown",
+            options = country_options,
+            value = DEFAULT_COUNTRY,
+            clearable = False,
+            style = {"width": "50%", "margin": "20px auto"}
+        ),
+
+        dcc.Store(id = "sport-store", data = sport_store),
+
+        dcc.Graph(id = "efficiency-graph"),
+        dcc.Graph(id = "medal-dist-graph"),
+        dcc.Graph(id = "age-graph"),
+        dcc.Graph(id = "sport-stats-graph"),
+        dcc.Graph(id = "weight-height-graph"),
+        dcc.Graph(id = "gender-and-age"),
+    ])
+
+
+def serve_layout(sport_store = None):
+    """Layout function for app.layout, Dash calls it on every page load. sport_store is a callable that returns
+    the sport-store data for a country, used in client-side mode."""
+    store = sport_store(DEFAULT_COUNTRY) if sport_store is not None else None
+    data = get_dataset()
+    return build_layout(static_figures(), data.country_index.options(), store, data.year_counts.span())
+
+
+def warm_up(*after):
+    """Loads the data, builds the static figures and then runs every callable in after. Sets ready when done,
+    so health checks can tell when the app is warm."""
+    global _warming
+    _warming = True
+    static_figures()
+    for task in after:
+        task()
+    ready.set()
+
+
+def start_warm_up(*after):
+    """Runs warm_up on a background thread."""
+    thread = threading.Thread(target = warm_up, args = after, name = "warm-up", daemon = True)
+    thread.start()
+    return thread
@@ -1,16 +1,472 @@
-import pandas as pd
+import os
+import json
+import warnings
 import hashlib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from metrics import timed, laps
+from filters import Rows
+
+ATHLETE_FILE = "athlete_events.csv"
+NOC_FILE = "noc_regions.csv"
+# Källfilerna får vara komprimerade, athlete_events.csv.gz eller .zst (kräver paketet zstandard) läses direkt.
+COMPRESSED_SUFFIXES = ("", ".gz", ".zst")
+CHUNK_ROWS = int(os.environ.get("OS_CHUNK_ROWS", 50_000))
+CACHE_DIR = os.environ.get("OS_CACHE_DIR", ".cache")
+CACHE_FRAMES = ("olympics", "germany_all", "germany")
+HASH_STORE = "name_hashes.feather"
+PARALLEL_HASH_MIN = 50_000
+
+# Kompakt schema som appliceras vid inläsning. Kolumner med få unika värden blir kategorier,
+# hashade namn blir heltalskoder mot en kategori-tabell.
+SCHEMA = {
+    "ID": "int32",
+    "Name": "category",
+    "Sex": "category",
+    "Age": "Int8",
+    "Height": "float32",
+    "Weight": "float32",
+    "Team": "category",
+    "NOC": "category",
+    "Games": "category",
+    "Year": "int16",
+    "Season": "category",
+    "City": "category",
+    "Sport": "category",
+    "Event": "category",
+    "Medal": "category",
+    "region": "category",
+    "notes": "category",
+    "Hash_Names": "category",
+    "Athlete": "int32",
+}
+
+# Kolumner och typer som läses ur athlete_events.csv. Strängar läses direkt som kategorier per chunk,
+# så ingen chunk håller Python-strängar per rad. Age läses som float eftersom den saknas ibland.
+CSV_DTYPES = {
+    "ID": "int32",
+    "Name": "category",
+    "Sex": "category",
+    "Age": "float32",
+    "Height": "float32",
+    "Weight": "float32",
+    "Team": "category",
+    "NOC": "category",
+    "Games": "category",
+    "Year": "int16",
+    "Season": "category",
+    "City": "category",
+    "Sport": "category",
+    "Event": "category",
+    "Medal": "category",
+}
+
+
+def source_path(name):
+    """Returns name, or name.gz / name.zst when only a compressed copy exists."""
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(name + suffix):
+            return name + suffix
+    return name
+
+
+def _clean_chunk(chunk, regions, notes, compact):
+    # NOC -> region per chunk med map i stället för en merge av hela tabellen.
+    chunk["region"] = chunk["NOC"].map(regions)
+    chunk["notes"] = chunk["NOC"].map(notes)
+    chunk = chunk.dropna(subset=['NOC', 'region', 'Name']) #Tar bort alla rader där någon av NOC, region eller name saknas. SE ÖVER DATARENSNING! //Seb
+    return apply_schema(chunk) if compact else chunk
+
+
+def _hash_column(names, known):
+    """Hash_Names for the Name column of the whole file. For a categorical every distinct name is hashed once,
+    in one batch, so that the process pool in _hash_with is used when the file has many new names."""
+    if not isinstance(names.dtype, pd.CategoricalDtype):
+        return _hash_with(names, known)
+    hashes = _hash_with(pd.Series(names.cat.categories), known).to_numpy()
+    # Sorterade kategorier, samma som astype("category") ger.
+    order = hashes.argsort()
+    rank = np.empty(len(order), dtype = np.int32)
+    rank[order] = np.arange(len(order), dtype = np.int32)
+    codes = names.cat.codes.to_numpy()
+    return pd.Series(pd.Categorical.from_codes(np.where(codes >= 0, rank[codes], -1), hashes[order]),
+                     index = names.index, name = "Hash_Names")
+
+
+class _Categories:
+    """Category table for one column, built up chunk by chunk. Every chunk only keeps its codes against the
+    shared table, so high-cardinality columns like Name are not stored once per chunk."""
+
+    def __init__(self):
+        self.values = None
+        self.codes = []
+
+    def add(self, column):
+        # Kategorier från bortfiltrerade rader ska inte följa med.
+        column = column.cat.remove_unused_categories()
+        categories = column.cat.categories
+        if self.values is None:
+            self.values = categories[:0]
+        positions = self.values.get_indexer(categories)
+        new = positions == -1
+        positions[new] = len(self.values) + np.arange(new.sum())
+        self.values = self.values.append(categories[new])
+        codes = column.cat.codes.to_numpy()
+        self.codes.append(np.where(codes >= 0, positions[codes], -1).astype(np.int32))
+
+    def categorical(self):
+        """All chunks as one Categorical with sorted categories, the same ones astype("category") would give."""
+        order = self.values.argsort()
+        rank = np.empty(len(order), dtype = np.int32)
+        rank[order] = np.arange(len(order), dtype = np.int32)
+        codes = np.concatenate(self.codes)
+        self.codes = []
+        return pd.Categorical.from_codes(np.where(codes >= 0, rank[codes], -1), self.values[order])
+
+
+def _read_clean(path, compact = True):
+    """Reads an athlete_events.csv-formatted file in chunks of CHUNK_ROWS rows. Every chunk is mapped to regions,
+    filtered and made compact before the next one is read, so peak memory stays close to the size of the
+    final frame. The names are hashed once for the whole file, after the chunks are joined."""
+    t = laps("load_and_clean_data")
+    noc = pd.read_csv(source_path(NOC_FILE))
+    regions = dict(zip(noc["NOC"], noc["region"]))
+    notes = dict(zip(noc["NOC"], noc["notes"]))
+    reader = pd.read_csv(path, usecols = list(CSV_DTYPES), dtype = CSV_DTYPES if compact else None, chunksize = CHUNK_ROWS)
+    parts = []
+    categories = {}
+    rows = 0
+    with reader:
+        for chunk in reader:
+            rows += len(chunk)
+            chunk = _clean_chunk(chunk, regions, notes, compact)
+            columns = list(chunk.columns)
+            for col in columns:
+                if isinstance(chunk[col].dtype, pd.CategoricalDtype):
+                    categories.setdefault(col, _Categories()).add(chunk.pop(col))
+            parts.append(chunk)
+    t.lap("read", rows = rows)
+    if not parts:
+        raise ValueError(f"{path}: no rows")
+
+    olympics = pd.concat(parts)
+    del parts
+    for col, table in categories.items():
+        olympics[col] = table.categorical()
+    olympics = olympics[columns]
+
+    # Nya namn från alla bitar hashas i en omgång, med processpoolen när de är minst PARALLEL_HASH_MIN.
+    known = _load_hash_store()
+    stored = len(known)
+    olympics["Hash_Names"] = _hash_column(olympics["Name"], known)
+    if len(known) > stored:
+        _save_hash_store(known)
+    del known
+    t.lap("hash")
+    olympics["Athlete"] = athlete_keys(olympics["Hash_Names"])
+    t.lap("concat", rows = len(olympics))
+    return olympics
+
+
+def athlete_keys(hashes):
+    """int32 surrogate key per athlete, the code of Hash_Names in its sorted category table. Distinct counts on
+    these are much cheaper than on the 64 character hashes, which stay in the frame."""
+    if isinstance(hashes.dtype, pd.CategoricalDtype):
+        return hashes.cat.codes.to_numpy(dtype = np.int32)
+    codes, _ = pd.factorize(hashes, sort = True)
+    return codes.astype(np.int32)
+
+
+def _clean_data(compact = True):
+    olympics = _read_clean(source_path(ATHLETE_FILE), compact)
+    return (olympics,) + germany_subsets(olympics)
+
+
+def read_delta(path):
+    """Reads a delta file with new rows in the athlete_events.csv format (e.g. the results of one new Games) and
+    cleans it like the main file. Raises ValueError when a column is missing or a value does not fit the schema."""
+    header = pd.read_csv(path, nrows = 0).columns
+    missing = [col for col in CSV_DTYPES if col not in header]
+    if missing:
+        raise ValueError(f"{path}: missing columns {', '.join(missing)}")
+    try:
+        return _read_clean(path)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"{path}: {e}") from e
+
+
+def _union_dtypes(*frames):
+    """Categorical dtypes with the sorted union of the categories in frames, per categorical column."""
+    dtypes = {}
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            categories = frames[0][col].cat.categories
+            for df in frames[1:]:
+                categories = categories.union(df[col].cat.categories)
+            dtypes[col] = pd.CategoricalDtype(categories)
+    return dtypes
+
+
+def check_new_games(delta, games):
+    """Raises ValueError when delta has rows of Games that are already loaded, games being the loaded Games values.
+    Appending them would count every medal and participant of those Games twice."""
+    overlap = sorted(set(delta["Games"].dropna().unique()) & set(games))
+    if overlap:
+        raise ValueError(f"the delta has rows of Games that are already loaded: {', '.join(overlap)}")
+
+
+def check_not_appended(path):
+    """Raises ValueError when the delta file at path, by content, is already recorded in the manifest."""
+    manifest = _read_manifest()
+    digest = _content_hash(path)
+    if manifest and any(delta["sha256"] == digest for delta in manifest.get("deltas", [])):
+        raise ValueError(f"{path} has already been appended")
+
+
+def append_frames(frames, delta):
+    """Returns olympics, germany_all and germany with the rows of delta (from read_delta) appended. The new rows get
+    index labels after the last existing one, and only the delta is filtered for the German subsets.
+    Raises ValueError when delta has rows of Games that are already in olympics."""
+    olympics = frames[0]
+    check_new_games(delta, olympics["Games"].dropna().unique())
+    start = int(olympics.index.max()) + 1 if len(olympics) else 0
+    delta = delta.set_axis(pd.RangeIndex(start, start + len(delta)))
+    dtypes = _union_dtypes(olympics, delta)
+    delta = delta.astype(dtypes)
+    new = (delta,) + germany_subsets(delta)
+    frames = tuple(pd.concat([old.astype(dtypes), rows]) for old, rows in zip(frames, new))
+    # Den sammanslagna kategoritabellen ger nya koder, så nycklarna räknas om för alla rader.
+    for df in frames:
+        df["Athlete"] = athlete_keys(df["Hash_Names"])
+    return frames
+
+
+def germany_subsets(olympics):
+    """Returns germany_all (GER, FRG and GDR) and germany (GER only)."""
+    # take() ger redan nya ramar, ingen extra kopia behövs.
+    germany_all = Rows(olympics).where(NOC = ['GER', 'FRG', 'GDR']).frame()
+    germany = Rows(germany_all).where(NOC = 'GER').frame()
+
+    return germany_all, germany
+
+
+def apply_schema(df):
+    """Casts the columns of df that are listed in SCHEMA to their compact dtype."""
+    return df.astype({col: dtype for col, dtype in SCHEMA.items() if col in df.columns})
+
+
+def memory_report(before, after):
+    """Returns bytes per column for two versions of the same frame, with the saving in percent."""
+    report = pd.DataFrame({
+        "dtype_before": before.dtypes.astype(str),
+        "bytes_before": before.memory_usage(deep = True, index = False),
+        "dtype_after": after.dtypes.astype(str),
+        "bytes_after": after.memory_usage(deep = True, index = False),
+    })
+    report.loc["Total"] = ["", report["bytes_before"].sum(), "", report["bytes_after"].sum()]
+    report["saved_percent"] = (100 * (1 - report["bytes_after"] / report["bytes_before"])).round(1)
+    return report
+
+
+def _sha256_all(names):
+    return [hashlib.sha256(name.encode('utf-8')).hexdigest() for name in names]
+
+
+def _load_hash_store():
+    try:
+        store = pd.read_feather(os.path.join(CACHE_DIR, HASH_STORE))
+    except (OSError, ValueError):
+        return {}
+    return dict(zip(store["Name"], store["Hash"]))
+
+
+def _save_hash_store(known):
+    os.makedirs(CACHE_DIR, exist_ok = True)
+    path = os.path.join(CACHE_DIR, HASH_STORE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    pd.DataFrame({"Name": list(known.keys()), "Hash": list(known.values())}).to_feather(tmp)
+    os.replace(tmp, path)
+
+
+def _hash_with(names, known):
+    """Hashes names with known as name -> hash memo, adding the names that were not in it."""
+    codes, uniques = pd.factorize(names)
+    new_names = [name for name in uniques if name not in known]
+
+    if len(new_names) >= PARALLEL_HASH_MIN:
+        workers = os.cpu_count() or 1
+        size = -(-len(new_names) // workers)
+        chunks = [new_names[i:i + size] for i in range(0, len(new_names), size)]
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            new_hashes = [h for chunk in pool.map(_sha256_all, chunks) for h in chunk]
+    else:
+        new_hashes = _sha256_all(new_names)
+    known.update(zip(new_names, new_hashes))
+
+    # Saknade namn har koden -1, som pekar på NaN sist i tabellen i stället för på det sista namnets hash.
+    unique_hashes = np.array([known[name] for name in uniques] + [np.nan], dtype = object)
+    return pd.Series(unique_hashes[codes], index = names.index, name = names.name)
+
+
+def hash_names(names, persist = True):
+    """SHA-256 hashes a Series of names, missing names stay missing. Every distinct name is hashed once and broadcast back through its
+    factorized code. Hashes are remembered in CACHE_DIR between runs, and when many names are new the work
+    is spread over a process pool."""
+    known = _load_hash_store() if persist else {}
+    stored = len(known)
+    hashed = _hash_with(names, known)
+    if persist and len(known) > stored:
+        _save_hash_store(known)
+    return hashed
+
+
+def _content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_state(previous = None):
+    """Returns size, mtime and content hash for every source file. The content hash is reused from the
+    previous manifest when size and mtime are unchanged, so a warm start does not have to read the CSVs."""
+    previous = previous or {}
+    state = {}
+    for path in (source_path(ATHLETE_FILE), source_path(NOC_FILE)):
+        stat = os.stat(path)
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+        old = previous.get(path, {})
+        if old.get("size") == entry["size"] and old.get("mtime") == entry["mtime"]:
+            entry["sha256"] = old["sha256"]
+        else:
+            entry["sha256"] = _content_hash(path)
+        state[path] = entry
+    return state
+
+
+def _same_sources(old, new):
+    return set(old) == set(new) and all(
+        old[path]["size"] == new[path]["size"] and old[path]["sha256"] == new[path]["sha256"] for path in new)
+
+
+def _read_manifest():
+    try:
+        with open(os.path.join(CACHE_DIR, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(frames, sources, deltas = ()):
+    os.makedirs(CACHE_DIR, exist_ok = True)
+    for name, df in zip(CACHE_FRAMES, frames):
+        # Feather kräver ett RangeIndex, så originalindexet sparas som en kolumn.
+        path = os.path.join(CACHE_DIR, f"{name}.feather")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        df.reset_index(names = "__index__").to_feather(tmp)
+        os.replace(tmp, path)
+    _write_manifest(sources, deltas)
+
+
+def _write_manifest(sources, deltas = ()):
+    """Writes the manifest last and atomically, so workers starting in parallel never see a half-written cache."""
+    path = os.path.join(CACHE_DIR, "manifest.json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"schema": SCHEMA, "sources": sources, "deltas": list(deltas)}, f, indent = 2)
+    os.replace(tmp, path)
+
+
+def save_appended(frames, path):
+    """Writes frames, the loaded frames with the delta file at path appended, to the cache and records the delta
+    in the manifest, so the next start reads it from the cache and a rebuild appends it again."""
+    manifest = _read_manifest()
+    valid = manifest and manifest.get("schema") == SCHEMA
+    sources = _source_state(manifest["sources"] if valid else None)
+    deltas = (manifest.get("deltas", []) if valid else []) + [{"path": path, "sha256": _content_hash(path)}]
+    _write_cache(frames, sources, deltas)
+
+
+def _replay_deltas(frames, manifest, sources):
+    """Appends the deltas recorded in manifest to freshly cleaned frames again. They only apply to the
+    athlete_events.csv they were appended to, a new athlete_events.csv replaces them."""
+    base = source_path(ATHLETE_FILE)
+    if not manifest or manifest["sources"].get(base, {}).get("sha256") != sources[base]["sha256"]:
+        return frames, []
+    kept = []
+    for delta in manifest.get("deltas", []):
+        if not os.path.exists(delta["path"]) or _content_hash(delta["path"]) != delta["sha256"]:
+            warnings.warn(f"{delta['path']} is missing or has changed since it was appended, skipping it")
+            continue
+        try:
+            frames = append_frames(frames, read_delta(delta["path"]))
+        except ValueError as e:
+            # T.ex. en delta som registrerats två gånger, raderna ska bara räknas en gång.
+            warnings.warn(f"{delta['path']}: {e}, skipping it")
+            continue
+        kept.append(delta)
+    return frames, kept
+
+
+def _read_cache():
+    frames = []
+    for name in CACHE_FRAMES:
+        df = pd.read_feather(os.path.join(CACHE_DIR, f"{name}.feather"))
+        df = df.set_index("__index__")
+        df.index.name = None
+        frames.append(df)
+    return tuple(frames)
+
+
+@timed("load_and_clean_data")
+def load_and_clean_data(use_cache = True):
+    """Loads athlete_events.csv and noc_regions.csv, merges and cleans them and returns olympics, germany_all and germany.
+    The cleaned frames are stored as Arrow (Feather) files in CACHE_DIR, keyed on size, mtime and content hash of the
+    source files, so later starts only rebuild them when an input has changed. Delta files appended with
+    save_appended are part of the cache and are appended again when it is rebuilt."""
+    if not use_cache:
+        return _clean_data()
+
+    t = laps("load_and_clean_data")
+    manifest = _read_manifest()
+    # Ett ändrat schema gör cachen ogiltig precis som en ändrad källfil.
+    previous = manifest["sources"] if manifest and manifest.get("schema") == SCHEMA else None
+    sources = _source_state(previous)
 
-def load_and_clean_data():
-    olympics = pd.read_csv("athlete_events.csv")
-    noc = pd.read_csv("noc_regions.csv")
-    olympics = olympics.merge(noc, on = "NOC", how = "left")
+    if previous is not None and _same_sources(previous, sources):
+        try:
+            frames = _read_cache()
+        except (OSError, KeyError, ValueError):
+            frames = None
+        if frames is not None:
+            t.lap("cache_read", rows = len(frames[0]))
+            if sources != previous:
+                # Bara mtime har ändrats (t.ex. efter en git checkout), innehållet är detsamma.
+                _write_manifest(sources, manifest.get("deltas", []))
+            return frames
 
-    olympics = olympics.dropna(subset=['NOC', 'region', 'Name']) #Tar bort alla rader där någon av NOC, region eller name saknas. SE ÖVER DATARENSNING! //Seb
+    frames, deltas = _replay_deltas(_clean_data(), manifest, sources)
+    _write_cache(frames, sources, deltas)
+    return frames
 
-    olympics['Hash_Names'] = olympics['Name'].apply(lambda x: hashlib.sha256(x.encode('utf-8')).hexdigest())
 
-    germany_all = olympics[olympics['NOC'].isin(['GER', 'FRG', 'GDR'])].copy()
-    germany = germany_all[germany_all['NOC'] == 'GER'].copy()
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description = "Prints the memory saved by SCHEMA, or appends a delta file to the cache.")
+    parser.add_argument("--append", metavar = "DELTA", help = "append the rows in DELTA (athlete_events.csv format) to the cache")
+    args = parser.parse_args()
 
-    return olympics, germany_all, germany
\ No newline at end of file
+    if args.append:
+        loaded = load_and_clean_data()
+        try:
+            check_not_appended(args.append)
+            frames = append_frames(loaded, read_delta(args.append))
+        except ValueError as e:
+            parser.error(str(e))
+        save_appended(frames, args.append)
+        print(f"{len(frames[0]) - len(loaded[0])} rows appended, {len(frames[0])} in total")
+    else:
+        raw, _, _ = _clean_data(compact = False)
+        print(memory_report(raw, apply_schema(raw)).to_string())
@@ -0,0 +1,144 @@
+"""Concurrent load test of the sport dropdown callback, run in-process through the Flask test client of main.server.
+
+Fires --requests dropdown changes from --concurrency threads, with sports drawn from a skewed distribution (a few
+sports get most of the traffic). Every change POSTs one request per graph to /_dash-update-component at the same
+time, like the browser does. Reports throughput, p50/p95/p99 latency until all graphs of a change are done and the
+latency, figure size and bytes on the wire per output graph. With --gzip the requests accept gzip like a browser,
+so the wire size is the compressed size.
+
+    python loadtest.py --requests 200 --concurrency 8
+    python loadtest.py --synthetic 10 --no-cache     # synthetic data at 10x, every request computes its figures
+    python loadtest.py --gzip                        # compressed responses, like a browser gets
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+OUTPUTS = ["efficiency-graph", "medal-dist-graph", "age-graph", "sport-stats-graph", "weight-height-graph", "gender-and-age"]  # main.GRAPHS
+
+
+def request_body(graph, sport, country, years = None):
+    """The JSON body the Dash renderer sends for one graph's callback when the sport dropdown changes.
+    years is the value of the year slider, [first, last] on a fresh page."""
+    return {
+        "output": f"{graph}.figure",
+        "outputs": {"id": graph, "property": "figure"},
+        "inputs": [
+            {"id": "sport-dropdown", "property": "value", "value": sport},
+            {"id": "country-dropdown", "property": "value", "value": country},
+            {"id": "year-slider", "property": "value", "value": years},
+        ],
+        "changedPropIds": ["sport-dropdown.value"],
+    }
+
+
+def sport_mix(sports, count, skew = 1.2, seed = 0):
+    """Draws count sports with Zipf-like weights, the first sport in the list being the most popular."""
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, len(sports) + 1) ** skew
+    return list(rng.choice(sports, count, p = weights / weights.sum()))
+
+
+def run(server, sports, country = "GER", requests = 200, concurrency = 8, accept_gzip = False, years = None):
+    """Returns the latency in seconds until all graphs of a dropdown change are done, wall time, the latency,
+    figure bytes and response bytes per output graph and the failed requests. Each change sends one request
+    per graph at once, like the browser does."""
+    local = threading.local()
+    latencies = []
+    graph_latencies = {graph: [] for graph in OUTPUTS}
+    payloads = {graph: [] for graph in OUTPUTS}
+    wire = {graph: [] for graph in OUTPUTS}
+    errors = []
+    lock = threading.Lock()
+    headers = {"Accept-Encoding": "gzip"} if accept_gzip else {}
+
+    def fire_graph(graph, sport):
+        if not hasattr(local, "client"):
+            local.client = server.test_client()
+        start = time.perf_counter()
+        response = local.client.post("/_dash-update-component", json = request_body(graph, sport, country, years), headers = headers)
+        elapsed = time.perf_counter() - start
+        with lock:
+            if response.status_code != 200:
+                errors.append((sport, graph, response.status_code))
+                return
+            graph_latencies[graph].append(elapsed)
+            body = response.get_data()
+            wire[graph].append(len(body))
+            if response.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            figure = json.loads(body)["response"][graph]["figure"]
+            payloads[graph].append(len(json.dumps(figure, separators = (",", ":"))))
+
+    def fire(sport, graph_pool):
+        start = time.perf_counter()
+        list(graph_pool.map(lambda graph: fire_graph(graph, sport), OUTPUTS))
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = concurrency * len(OUTPUTS)) as graph_pool, \
+            ThreadPoolExecutor(max_workers = concurrency) as pool:
+        list(pool.map(lambda sport: fire(sport, graph_pool), sport_mix(sports, requests)))
+    wall = time.perf_counter() - start
+    return latencies, wall, graph_latencies, payloads, wire, errors
+
+
+def report(latencies, wall, graph_latencies, payloads, wire, errors):
+    lines = []
+    if latencies:
+        p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        lines.append(f"changes: {len(latencies)}  errors: {len(errors)}  wall: {wall:.2f} s  throughput: {len(latencies) / wall:.1f} changes/s")
+        lines.append(f"latency ms  p50: {p50:.1f}  p95: {p95:.1f}  p99: {p99:.1f}  max: {max(latencies) * 1000:.1f}")
+    lines.append(f"{'graph':<22}{'p50 ms':>10}{'p95 ms':>10}{'mean KB':>10}{'max KB':>10}{'wire KB':>10}")
+    for graph, sizes in payloads.items():
+        if sizes:
+            p50, p95 = np.percentile(np.array(graph_latencies[graph]) * 1000, [50, 95])
+            lines.append(f"{graph:<22}{p50:>10.1f}{p95:>10.1f}{np.mean(sizes) / 1024:>10.1f}{max(sizes) / 1024:>10.1f}"
+                         f"{np.mean(wire[graph]) / 1024:>10.1f}")
+    for sport, graph, status in errors[:10]:
+        lines.append(f"error: {sport} {graph} -> HTTP {status}")
+    return "\n".join(lines)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type = int, default = 200)
+    parser.add_argument("--concurrency", type = int, default = 8)
+    parser.add_argument("--country", default = "GER")
+    parser.add_argument("--sports", nargs = "+", help = "sports in order of popularity, default the dropdown sports")
+    parser.add_argument("--synthetic", type = float, help = "use synthetic data at this scale instead of athlete_events.csv")
+    parser.add_argument("--no-cache", action = "store_true", help = "disable the figure cache so every request computes")
+    parser.add_argument("--gzip", action = "store_true", help = "accept gzip compressed responses")
+    args = parser.parse_args(argv)
+
+    os.environ["OS_LAZY"] = "1"
+    import main as app
+    import dataset
+    from layout import SPORTS
+
+    if args.synthetic:
+        from benchmark import make_synthetic
+        from load_data import germany_subsets
+        olympics = make_synthetic(args.synthetic)
+        dataset.set_dataset(dataset.Dataset(olympics, *germany_subsets(olympics)))
+    if args.no_cache:
+        app.figure_cache.max_bytes = 0
+
+    # Första anropet sätter upp Dash-servern och läser in datan, det ska inte räknas in i latensen.
+    app.server.test_client().get("/_dash-layout")
+
+    years = list(dataset.get_dataset().year_counts.span())
+    print(report(*run(app.server, args.sports or SPORTS, args.country, args.requests, args.concurrency, args.gzip, years)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
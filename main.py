@@ -1,31 +1,261 @@
+import os
+import threading
 import dash
 from dash import Input, Output
-from layout import layout, olympics, germany
+import layout
+from layout import SPORTS, DEFAULT_COUNTRY, CLIENTSIDE
+from dataset import get_dataset, set_dataset
+from load_data import read_delta, save_appended, check_not_appended
+from figure_cache import FigureCache, warm_up
 import Functions
+import fastfig
+import metrics
+import http_cache
+
+figure_cache = FigureCache()
 
 app = dash.Dash(__name__)
-server = app.server
-app.layout = layout
-
-@app.callback(
-    [Output("efficiency-graph", "figure"),
-     Output("medal-dist-graph", "figure"),
-     Output("age-graph", "figure"),
-     Output("sport-stats-graph", "figure"),
-     Output("weight-height-graph", "figure"),
-     Output("gender-and-age", "figure")],
-    Input("sport-dropdown", "value"),
-)
-
-def update_graphs(selected_sport):
-    fig9 = Functions.medal_distribution(olympics, selected_sport)
-    fig10 = Functions.age_dist_per_sex(olympics, germany, "Germany", selected_sport)
-    fig11 = Functions.plot_efficiency(olympics, germany, "Germany", selected_sport)
-    fig12, _ = Functions.stats_for_sport(olympics, selected_sport)
-    fig13, _ = Functions.medal_distribution_weight_height(olympics, sport = selected_sport)
-    fig14 = Functions.sex_biat(olympics, selected_sport)
-    return fig9, fig10, fig11, fig12, fig13, fig14
+server = http_cache.install(app.server)
+#Skelettet har samma id:n som den riktiga layouten, så Dash kan validera callbacks utan att läsa in data.
+app.validation_layout = layout.build_layout(None)
+
+
+def _sport(selected_sport):
+    #Funktionerna får sport-partitionens rader i stället för hela tabellen, och kopierar bara kolumnerna de läser.
+    data = get_dataset()
+    t = metrics.laps("sport_partition")
+    sport_df = data.sport_index.select(selected_sport)
+    t.lap("filter", rows = len(sport_df))
+    return data, sport_df
+
+
+def _country(data, selected_sport, selected_country):
+    countries = data.country_index
+    return countries.select(selected_country, selected_sport), countries.label(selected_country)
+
+
+def _years(year_range):
+    """The year slider value as (start, end), or None when it covers every year, so that the default view gives
+    the same figures as without the slider."""
+    if year_range is None:
+        return None
+    start, end = year_range
+    first, last = get_dataset().year_counts.span()
+    return None if start <= first and end >= last else (start, end)
+
+
+def _all_years():
+    #Samma värde som reglaget skickar från början, så uppvärmningen fyller samma cachenycklar.
+    return list(get_dataset().year_counts.span())
+
+
+#En callback per graf: Dash skickar dem som separata anrop, så varje graf ritas så fort den är klar
+#och servern kan räkna ut dem parallellt. Graf-id:na är desamma som när allt var en callback.
+#year_range är årsreglagets värde, None för alla år.
+@metrics.timed("medal_distribution_graph")
+@figure_cache.memoize
+def medal_distribution_graph(selected_sport, selected_country = DEFAULT_COUNTRY, year_range = None):
+    data, sport_df = _sport(selected_sport)
+    nocs = data.country_index.nocs(selected_country)
+    return Functions.medal_distribution(sport_df, selected_sport, cube = data.medal_cube, noc = nocs,
+                                        years = _years(year_range), counts = data.year_counts)
+
+
+@metrics.timed("age_graph")
+@figure_cache.memoize
+def age_graph(selected_sport, selected_country = DEFAULT_COUNTRY, year_range = None):
+    data, sport_df = _sport(selected_sport)
+    country_sport_df, country = _country(data, selected_sport, selected_country)
+    return Functions.age_dist_per_sex(sport_df, country_sport_df, country, selected_sport, years = _years(year_range))
+
+
+@metrics.timed("efficiency_graph")
+@figure_cache.memoize
+def efficiency_graph(selected_sport, selected_country = DEFAULT_COUNTRY, year_range = None):
+    #Bara antal rader behövs, de läses ur årsräkningarna utan att sportens rader väljs ut.
+    data = get_dataset()
+    countries = data.country_index
+    return Functions.plot_efficiency(None, None, countries.label(selected_country), selected_sport, years = _years(year_range),
+                                     counts = data.year_counts, nocs = countries.nocs(selected_country))
+
+
+@metrics.timed("sport_stats_graph")
+@figure_cache.memoize
+def sport_stats_graph(selected_sport, selected_country = DEFAULT_COUNTRY, year_range = None):
+    data, sport_df = _sport(selected_sport)
+    fig, _ = Functions.stats_for_sport(sport_df, selected_sport, cube = data.medal_cube, years = _years(year_range))
+    return fig
+
+
+@metrics.timed("weight_height_graph")
+@figure_cache.memoize
+def weight_height_graph(selected_sport, selected_country = DEFAULT_COUNTRY, year_range = None):
+    _, sport_df = _sport(selected_sport)
+    fig, _ = Functions.medal_distribution_weight_height(sport_df, sport = selected_sport, years = _years(year_range))
+    return fig
+
+
+@metrics.timed("sex_graph")
+@figure_cache.memoize
+def sex_graph(selected_sport, selected_country = DEFAULT_COUNTRY, year_range = None):
+    _, sport_df = _sport(selected_sport)
+    return Functions.sex_biat(sport_df, selected_sport, years = _years(year_range))
+
+
+#Inte i figurcachen: varje rörelse i reglaget ger ett nytt intervall, och figuren är billig ur YearCounts.
+@metrics.timed("sex_range_graph")
+def sex_range_graph(year_range):
+    """Gender distribution of FRG, GDR and GER in the years of the year slider, from the cumulative year counts.
+    year_range is the drag_value of the slider, None until it has been dragged."""
+    counts = get_dataset().year_counts
+    start, end = year_range or counts.span()
+    return Functions.sex_dist_all(None, years = (start, end), counts = counts)
+
+
+@metrics.timed("medal_range_graphs")
+@figure_cache.memoize
+def medal_range_graphs(year_range):
+    """The medal charts of the country section (layout.RANGE_GRAPHS) for the years of the year slider."""
+    return layout.medal_range_figures(_years(year_range))
+
+
+#Graf-id -> callback, i samma ordning som utgångarna i den gamla update_graphs.
+GRAPHS = {
+    "efficiency-graph": medal_distribution_graph,
+    "medal-dist-graph": age_graph,
+    "age-graph": efficiency_graph,
+    "sport-stats-graph": sport_stats_graph,
+    "weight-height-graph": weight_height_graph,
+    "gender-and-age": sex_graph,
+}
+
+
+
+def _without_template(fig):
+    fig = fig if isinstance(fig, dict) else fig.to_plotly_json()
+    return dict(fig, layout = {key: value for key, value in fig["layout"].items() if key != "template"})
+
+
+@figure_cache.memoize
+def sport_store(selected_country = DEFAULT_COUNTRY, year_range = None):
+    """The data of the sport-store in client-side mode: the six figures of every sport in the dropdown for one
+    country and year range, in the order of GRAPHS. The figures hold only aggregates (counts, bins, ratios), and
+    the template they share is sent once instead of in every figure."""
+    year_range = year_range or _all_years()
+    figures = {sport: [_without_template(callback(sport, selected_country, year_range)) for callback in GRAPHS.values()]
+               for sport in SPORTS}
+    return {"template": fastfig.template(), "figures": figures}
+
+
+#Ritar om de sex graferna i webbläsaren från sport-store när sporten byts.
+SWITCH_SPORT_JS = """
+function(sport, store) {
+    if (!store || !store.figures[sport]) {
+        return window.dash_clientside.no_update;
+    }
+    return store.figures[sport].map(function(fig) {
+        return Object.assign({}, fig, {layout: Object.assign({}, fig.layout, {template: store.template})});
+    });
+}
+"""
+
+app.callback(Output("sex-range-graph", "figure"), Input("year-slider", "drag_value"))(sex_range_graph)
+#Sidan har redan figurerna för alla år, så de ritas om först när reglaget flyttas.
+app.callback(
+    [Output(graph_id, "figure") for graph_id in layout.RANGE_GRAPHS.values()],
+    Input("year-slider", "value"),
+    prevent_initial_call = True,
+)(medal_range_graphs)
+
+if CLIENTSIDE:
+    #Bara ett byte av land eller årsintervall går till servern, och skickar då alla sporter på en gång.
+    app.layout = lambda: layout.serve_layout(sport_store)
+    app.callback(
+        Output("sport-store", "data"),
+        Input("country-dropdown", "value"),
+        Input("year-slider", "value"),
+        prevent_initial_call = True,
+    )(sport_store)
+    app.clientside_callback(
+        SWITCH_SPORT_JS,
+        [Output(graph_id, "figure") for graph_id in GRAPHS],
+        Input("sport-dropdown", "value"),
+        Input("sport-store", "data"),
+    )
+else:
+    app.layout = layout.serve_layout
+    for graph_id, callback in GRAPHS.items():
+        app.callback(
+            Output(graph_id, "figure"),
+            Input("sport-dropdown", "value"),
+            Input("country-dropdown", "value"),
+            Input("year-slider", "value"),
+        )(callback)
+
+
+def update_graphs(selected_sport, selected_country = DEFAULT_COUNTRY, year_range = None):
+    """All six sport figures in one call, in the order of GRAPHS, for every year unless year_range is given.
+    Not a callback, used by the warm-up and the benchmark."""
+    year_range = year_range or _all_years()
+    return tuple(callback(selected_sport, selected_country, year_range) for callback in GRAPHS.values())
+
+
+_append_lock = threading.Lock()
+
+
+def append_games(path, persist = True):
+    """Appends the rows in the delta file at path (e.g. the results of one new Games) to the running app.
+    Indexes and the medal cube are extended with the new rows only, and only cached figures for the sports
+    in the delta are dropped. The static country figures are rebuilt on the next page load, since several
+    of them cover all rows. With persist the Feather cache is updated too, so the next start includes the rows.
+    Raises ValueError when the file is already appended or has rows of Games that are already loaded."""
+    delta = read_delta(path)
+    with _append_lock:
+        check_not_appended(path)
+        data = get_dataset().append(delta)
+        #DuckDB-backenden har redan skrivit deltan som en Parquet-fil.
+        if persist and data.olympics is not None:
+            save_appended((data.olympics, data.germany_all, data.germany), path)
+        #Datan byts och figurerna tas bort under samma lås. Figurer som räknas ut på den gamla datan
+        #sparas inte efter discard, se FigureCache.generation.
+        set_dataset(data)
+        sports = set(delta["Sport"].unique())
+        figure_cache.discard(lambda key: key[0] in ("sport_store", "medal_range_graphs") or key[1] in sports)
+        layout.reset_static_figures()
+    return data
+
+
+@server.route("/healthz")
+def healthz():
+    """200 when data, static figures and (optionally) the figure cache are warm, otherwise 503."""
+    if layout.ready.is_set():
+        return "ready", 200
+    return "warming up", 503
+
+
+@server.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text, empty unless the app runs with OS_METRICS=1."""
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+
+def start_warm_up(background = True):
+    """Starts the warm-up, with OS_WARM_FIGURES=1 it also renders every sport in the dropdown.
+    gunicorn.conf.py runs it in the foreground in the master process, before the workers are forked."""
+    tasks = []
+    if os.environ.get("OS_WARM_FIGURES") == "1":
+        tasks.append(lambda: warm_up(update_graphs, SPORTS))  # med standardlandet
+    if CLIENTSIDE:
+        tasks.append(lambda: sport_store(DEFAULT_COUNTRY))
+    if background:
+        return layout.start_warm_up(*tasks)
+    layout.warm_up(*tasks)
+
+
+#Sätt OS_LAZY=1 för att inte starta uppvärmningen vid import (t.ex. i tester), då laddas allt vid första anropet.
+if os.environ.get("OS_LAZY") != "1":
+    start_warm_up()
 
 
 if __name__ == "__main__":
-    app.run(debug = True)
\ No newline at end of file
+    app.run(debug = True)
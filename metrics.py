@@ -0,0 +1,142 @@
+"""Opt-in timing of the hot paths, exposed as Prometheus text on /metrics.
+
+Turn it on with OS_METRICS=1. When it is off, timed() calls straight through and laps() hands out a shared
+object whose lap() does nothing, so the instrumented code pays next to nothing.
+
+    @timed("load_and_clean_data")
+    def load_and_clean_data(): ...
+
+    def medal_distribution(df, sport):
+        t = laps("medal_distribution")
+        df = df[df["Sport"] == sport]
+        t.lap("filter", rows = len(df))
+        ...
+        t.lap("figure")
+"""
+import os
+import time
+import functools
+import threading
+
+ENABLED = os.environ.get("OS_METRICS") == "1"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_stage_seconds = {}
+_stage_calls = {}
+_rows = {}
+_payload_bytes = {}
+_latency = {}
+
+
+def enable(on = True):
+    global ENABLED
+    ENABLED = on
+
+
+def reset():
+    with _lock:
+        for store in (_stage_seconds, _stage_calls, _rows, _payload_bytes, _latency):
+            store.clear()
+
+
+def record(name, stage, seconds, rows = None):
+    key = (name, stage)
+    with _lock:
+        _stage_seconds[key] = _stage_seconds.get(key, 0.0) + seconds
+        _stage_calls[key] = _stage_calls.get(key, 0) + 1
+        if rows is not None:
+            _rows[key] = _rows.get(key, 0) + rows
+
+
+def record_payload(name, output, size):
+    key = (name, output)
+    with _lock:
+        _payload_bytes[key] = _payload_bytes.get(key, 0) + size
+
+
+def _observe(name, seconds):
+    with _lock:
+        counts = _latency.setdefault(name, [0] * (len(LATENCY_BUCKETS) + 1) + [0.0])
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                counts[i] += 1
+        counts[len(LATENCY_BUCKETS)] += 1
+        counts[-1] += seconds
+
+
+class _Laps:
+    def __init__(self, name):
+        self.name = name
+        self.last = time.perf_counter()
+
+    def lap(self, stage, rows = None):
+        """Records the time since the previous lap (or since laps() was called) under stage."""
+        now = time.perf_counter()
+        record(self.name, stage, now - self.last, rows)
+        self.last = now
+
+
+class _NoLaps:
+    def lap(self, stage, rows = None):
+        pass
+
+
+_NO_LAPS = _NoLaps()
+
+
+def laps(name):
+    """Returns a lap timer for one call of name, or a no-op timer when metrics are off."""
+    return _Laps(name) if ENABLED else _NO_LAPS
+
+
+def timed(name):
+    """Decorator recording the total time of every call in a latency histogram and as stage "total"."""
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                record(name, "total", elapsed)
+                _observe(name, elapsed)
+
+        return wrapper
+
+    return decorate
+
+
+def _labels(**labels):
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in labels.items()) + "}"
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        stage_seconds = dict(_stage_seconds)
+        stage_calls = dict(_stage_calls)
+        rows = dict(_rows)
+        payload_bytes = dict(_payload_bytes)
+        latency = {name: list(counts) for name, counts in _latency.items()}
+
+    lines = ["# HELP os_stage_seconds_total Time spent per function and stage.", "# TYPE os_stage_seconds_total counter"]
+    lines += [f"os_stage_seconds_total{_labels(function = n, stage = s)} {v:.6f}" for (n, s), v in sorted(stage_seconds.items())]
+    lines += ["# HELP os_stage_calls_total Number of timed calls per function and stage.", "# TYPE os_stage_calls_total counter"]
+    lines += [f"os_stage_calls_total{_labels(function = n, stage = s)} {v}" for (n, s), v in sorted(stage_calls.items())]
+    lines += ["# HELP os_stage_rows_total Rows handled per function and stage.", "# TYPE os_stage_rows_total counter"]
+    lines += [f"os_stage_rows_total{_labels(function = n, stage = s)} {v}" for (n, s), v in sorted(rows.items())]
+    lines += ["# HELP os_payload_bytes_total Serialized figure bytes per callback and output.", "# TYPE os_payload_bytes_total counter"]
+    lines += [f"os_payload_bytes_total{_labels(function = n, output = o)} {v}" for (n, o), v in sorted(payload_bytes.items())]
+    lines += ["# HELP os_call_seconds Call latency per timed function.", "# TYPE os_call_seconds histogram"]
+    for name, counts in sorted(latency.items()):
+        for bound, count in zip(LATENCY_BUCKETS, counts):
+            lines.append(f"os_call_seconds_bucket{_labels(function = name, le = bound)} {count}")
+        lines.append(f"os_call_seconds_bucket{_labels(function = name, le = '+Inf')} {counts[len(LATENCY_BUCKETS)]}")
+        lines.append(f"os_call_seconds_count{_labels(function = name)} {counts[len(LATENCY_BUCKETS)]}")
+        lines.append(f"os_call_seconds_sum{_labels(function = name)} {counts[-1]:.6f}")
+    return "\n".join(lines) + "\n"
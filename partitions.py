@@ -0,0 +1,99 @@
+import numpy as np
+from filters import Rows
+
+
+class PartitionIndex:
+    """Maps every value of one or more key columns to the row positions where it occurs, so a partition
+    (e.g. all rows for one sport) can be sliced out without a boolean scan over the whole frame.
+    Build it once at load time, e.g. PartitionIndex(olympics, "Sport") or PartitionIndex(olympics, ["Sport", "NOC"])."""
+
+    def __init__(self, df, by, positions = None):
+        self.df = df
+        self.by = by
+        if positions is None:
+            positions = {key: np.asarray(pos) for key, pos in df.groupby(by, observed = True, sort = False).indices.items()}
+        self.positions = positions
+
+    def extended(self, df, start):
+        """Returns an index over df, whose first start rows are the rows this index was built from. Only the rows
+        from start on are grouped, and only the keys that occur in them get new positions."""
+        positions = dict(self.positions)
+        for key, pos in df.iloc[start:].groupby(self.by, observed = True, sort = False).indices.items():
+            pos = np.asarray(pos) + start
+            positions[key] = np.concatenate([positions[key], pos]) if key in positions else pos
+        return PartitionIndex(df, self.by, positions)
+
+    def keys(self):
+        return self.positions.keys()
+
+    def rows(self, key):
+        """Row positions for key, an empty array when the key does not occur."""
+        return self.positions.get(key, np.empty(0, dtype = np.intp))
+
+    def get(self, key):
+        """Returns the partition for key as a DataFrame with the same columns and index labels as the full frame."""
+        return self.df.take(self.rows(key))
+
+    def select(self, key):
+        """The partition for key as Rows, the columns are only copied when the rows are materialized."""
+        return Rows(self.df, self.rows(key))
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class CountryIndex:
+    """Row positions per country. A country is either a NOC code (e.g. "GER") or a region name from
+    noc_regions.csv, which groups historical NOCs together (e.g. "Germany" is GER, FRG, GDR and SAA).
+    Subsets are sliced from precomputed positions, optionally within one sport, without a scan over the frame."""
+
+    def __init__(self, df, noc_index = None, sport_noc_index = None, groups = None):
+        self.df = df
+        self.noc_index = PartitionIndex(df, "NOC") if noc_index is None else noc_index
+        self.sport_noc_index = PartitionIndex(df, ["Sport", "NOC"]) if sport_noc_index is None else sport_noc_index
+        if groups is None:
+            nocs_per_region = df.groupby("region", observed = True)["NOC"].unique()
+            groups = {region: sorted(nocs) for region, nocs in nocs_per_region.items()}
+        self.groups = groups
+        self.regions = {noc: region for region, nocs in self.groups.items() for noc in nocs}
+
+    def extended(self, df, start):
+        """Returns an index over df, whose first start rows are the rows this index was built from (see PartitionIndex.extended)."""
+        groups = dict(self.groups)
+        for region, nocs in df.iloc[start:].groupby("region", observed = True)["NOC"].unique().items():
+            groups[region] = sorted(set(groups.get(region, [])) | set(nocs))
+        return CountryIndex(df, self.noc_index.extended(df, start), self.sport_noc_index.extended(df, start), groups)
+
+    def nocs(self, country):
+        """The NOC codes behind country, an empty list for an unknown country."""
+        if country in self.regions:
+            return [country]
+        return self.groups.get(country, [])
+
+    def label(self, country):
+        """Display name, the region name for a NOC code (GER -> Germany)."""
+        return self.regions.get(country, country)
+
+    def rows(self, country, sport = None):
+        """Row positions for country (and sport), in frame order."""
+        if sport is None:
+            parts = [self.noc_index.rows(noc) for noc in self.nocs(country)]
+        else:
+            parts = [self.sport_noc_index.rows((sport, noc)) for noc in self.nocs(country)]
+        if len(parts) == 1:
+            return parts[0]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype = np.intp)
+
+    def get(self, country, sport = None):
+        return self.df.take(self.rows(country, sport))
+
+    def select(self, country, sport = None):
+        """The subset for country (and sport) as Rows, see PartitionIndex.select."""
+        return Rows(self.df, self.rows(country, sport))
+
+    def options(self):
+        """Dropdown options, one per NOC plus one per region that groups several NOCs."""
+        options = [{"label": f"{region} ({noc})", "value": noc} for noc, region in self.regions.items()]
+        options += [{"label": f"{region} ({', '.join(nocs)})", "value": region}
+                    for region, nocs in self.groups.items() if len(nocs) > 1]
+        return sorted(options, key = lambda option: option["label"])
@@ -0,0 +1,150 @@
+"""Offline report: renders the dashboard's figures to static files, without running the Dash server.
+
+Writes the country figures of layout.py once and the six sport graphs of main.GRAPHS for every sport in the data
+(not only the dropdown sports) and every country given, as JSON and standalone HTML, plus images when kaleido is
+installed. The data is loaded once in this process. The sport/country jobs run in a pool of forked processes that
+share the loaded Dataset copy-on-write, like the gunicorn workers do, so no job reloads it.
+
+    python report.py                                   # every sport for GER, into report/
+    python report.py --countries GER Germany SWE --workers 8 --out /var/www/report
+    python report.py --countries all --formats json    # every country in the country dropdown, JSON only
+    python report.py --formats json html png           # images need the kaleido package
+"""
+import os
+import re
+import sys
+import html
+import time
+import inspect
+import argparse
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+FORMATS = ("json", "html", "png", "svg")
+IMAGE_FORMATS = ("png", "svg")
+
+
+def slug(name):
+    """A file name for a sport or country, e.g. "Ski Jumping" -> "Ski_Jumping"."""
+    return re.sub(r"[^\w-]+", "_", str(name)).strip("_")
+
+
+def write_figure(fig, path, formats):
+    """Writes fig to path + one suffix per format and returns the written paths."""
+    import fastfig
+    import plotly.io as pio
+    written = []
+    for fmt in formats:
+        target = f"{path}.{fmt}"
+        if fmt == "json":
+            with open(target, "w", encoding = "utf-8") as f:
+                f.write(fastfig.to_json(fig))
+        elif fmt == "html":
+            pio.write_html(fig, target, include_plotlyjs = "cdn", validate = False)
+        else:
+            pio.write_image(fig, target, format = fmt, validate = False)
+        written.append(target)
+    return written
+
+
+def render_sport(job):
+    """Renders the six sport graphs for one (sport, country) and returns the written paths. Runs in a worker."""
+    import main
+    sport, country, out, formats = job
+    directory = os.path.join(out, slug(sport), slug(country))
+    os.makedirs(directory, exist_ok = True)
+    written = []
+    for callback in main.GRAPHS.values():
+        # Utan figurcachen och metrics, varje figur ritas en gång.
+        fig = inspect.unwrap(callback)(sport, country)
+        written += write_figure(fig, os.path.join(directory, callback.__name__), formats)
+    return written
+
+
+def render_static(out, formats):
+    """Renders the country figures of layout.py and the year slider graph for every year, its default range."""
+    import main
+    import layout
+    directory = os.path.join(out, "country")
+    os.makedirs(directory, exist_ok = True)
+    written = []
+    for name, fig in zip(layout.STATIC_NAMES, layout.static_figures()):
+        written += write_figure(fig, os.path.join(directory, name), formats)
+    fig = inspect.unwrap(main.sex_range_graph)(None)
+    written += write_figure(fig, os.path.join(directory, "sex_range_graph"), formats)
+    return written
+
+
+def _reload_in_worker():
+    # DuckDB-anslutningar kan inte delas över fork, varje process öppnar en egen.
+    import dataset
+    dataset.set_dataset(None)
+
+
+def write_index(out, paths):
+    """An index.html linking every HTML file, or every file when no HTML was written."""
+    links = sorted(p for p in paths if p.endswith(".html")) or sorted(paths)
+    items = "\n".join(f'<li><a href="{html.escape(os.path.relpath(p, out))}">{html.escape(os.path.relpath(p, out))}</a></li>'
+                      for p in links)
+    path = os.path.join(out, "index.html")
+    with open(path, "w", encoding = "utf-8") as f:
+        f.write(f"<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Olympic report</title></head>\n"
+                f"<body><h1>Olympic report</h1>\n<ul>\n{items}\n</ul></body></html>\n")
+    return path
+
+
+def run(out, sports = None, countries = None, formats = ("json", "html"), workers = None):
+    """Renders everything and returns the written paths. sports defaults to every sport in the data,
+    countries to the default country, "all" means every country in the country dropdown."""
+    # Ingen uppvärmning, bara datan laddas här.
+    os.environ["OS_LAZY"] = "1"
+    import dataset
+    from layout import DEFAULT_COUNTRY
+
+    data = dataset.get_dataset()
+    sports = sports or sorted(data.sport_index.keys())
+    countries = countries or [DEFAULT_COUNTRY]
+    if countries == ["all"]:
+        countries = [option["value"] for option in data.country_index.options()]
+
+    os.makedirs(out, exist_ok = True)
+    written = render_static(out, formats)
+    jobs = [(sport, country, out, formats) for sport in sports for country in countries]
+
+    # fork delar den laddade datan med barnprocesserna, utan fork laddar varje process den själv.
+    fork = "fork" in multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if fork else None)
+    initializer = _reload_in_worker if data.olympics is None else None
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for paths in map(render_sport, jobs):
+            written += paths
+    else:
+        with ProcessPoolExecutor(max_workers = workers, mp_context = context, initializer = initializer) as pool:
+            for paths in pool.map(render_sport, jobs, chunksize = max(1, len(jobs) // (workers * 4))):
+                written += paths
+    written.append(write_index(out, written))
+    return written
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default = "report", help = "output directory, default report/")
+    parser.add_argument("--sports", nargs = "+", help = "default every sport in the data")
+    parser.add_argument("--countries", nargs = "+", help = "NOC codes or region names, \"all\" for every country, default GER")
+    parser.add_argument("--formats", nargs = "+", choices = FORMATS, default = ["json", "html"])
+    parser.add_argument("--workers", type = int, help = "processes, default the number of CPUs")
+    args = parser.parse_args(argv)
+
+    if set(args.formats) & set(IMAGE_FORMATS) and importlib.util.find_spec("kaleido") is None:
+        parser.error("png and svg need the kaleido package")
+
+    start = time.perf_counter()
+    written = run(args.out, args.sports, args.countries, args.formats, args.workers)
+    print(f"{len(written)} files written to {args.out} in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())